@@ -1,9 +1,16 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+import argparse
 import random
 import time
 
+import instantaneas
+import nucleos
+import perfilado
+import trayectorias
+import vecindades
+
 # Constantes de configuración
 TAMAÑO = 25  # Tamaño del espacio 3D
 PASOS = 50   # Número de pasos de simulación
@@ -25,113 +32,174 @@ ALIGNMENT_RADIUS = 2
 COHESION_RADIUS = 2
 FLEE_RADIUS = 3
 
-# Inicializar grid 3D
-grid = np.zeros((TAMAÑO, TAMAÑO, TAMAÑO), dtype=np.uint8)
+# Direcciones posibles de los depredadores (vecindad de 18 sin el centro)
+DIRECCIONES_DEPREDADOR = [
+    (-1,0,0), (1,0,0), (0,-1,0), (0,1,0), (0,0,-1), (0,0,1),
+    (-1,-1,0), (-1,1,0), (1,-1,0), (1,1,0),
+    (-1,0,-1), (-1,0,1), (1,0,-1), (1,0,1),
+    (0,-1,-1), (0,-1,1), (0,1,-1), (0,1,1)
+]
+
+# Cómo se dibuja cada tipo de entidad en los visores 3D (argumentos de ax.scatter)
+ESTILOS = {
+    FISH: {'c': 'cyan', 's': 20, 'alpha': 0.7, 'label': 'Peces', 'depthshade': True},
+    PREDATOR: {'c': 'red', 's': 50, 'alpha': 0.9, 'label': 'Depredadores', 'depthshade': True},
+    OBSTACLE: {'c': 'gray', 's': 40, 'alpha': 0.5, 'label': 'Obstáculos', 'depthshade': True},
+}
+
+class EstadoCardumen:
+    """Estado de la simulación guardado en arrays contiguos.
+
+    Cada pez es una fila de `posiciones` (int16) y `direcciones` (int8);
+    depredadores y obstáculos son arrays (M, 3) de posiciones. Las columnas
+    opcionales por pez (especie, estado...) se añaden con agregar_columna.
+
+    grid, posiciones y direcciones tienen cada uno un array de reserva del
+    mismo tamaño: simular_paso escribe el paso siguiente en la reserva y
+    luego los intercambia, así que no reserva memoria nueva en cada paso.
+
+    motor_movimiento elige cómo se resuelven los movimientos de los peces:
+    "numba" (nucleos.py) o "python"; con None, numba si está instalado.
+
+    Si se asigna un `perfil` (perfilado.Perfil), simular_paso y
+    mover_depredadores registran el tiempo de cada fase.
+    """
+
+    def __init__(self, tamaño=TAMAÑO, motor_movimiento=None):
+        self.tamaño = tamaño
+        self.motor_movimiento = nucleos.elegir(motor_movimiento)
+        self.grid = np.zeros((tamaño, tamaño, tamaño), dtype=np.uint8)
+        # Índice de cada pez en `posiciones` por celda (-1 si no hay pez),
+        # para encontrar al vecino en O(1)
+        self.indice_peces = np.full((tamaño, tamaño, tamaño), -1, dtype=np.int32)
+        self.posiciones = np.zeros((0, 3), dtype=np.int16)
+        self.direcciones = np.zeros((0, 3), dtype=np.int8)
+        self.depredadores = np.zeros((0, 3), dtype=np.int16)
+        self.obstaculos = np.zeros((0, 3), dtype=np.int16)
+        self.columnas = {}
+        self._reservas = {}
+        self.perfil = perfilado.NULO
+
+    def reserva(self, nombre):
+        """Array libre con la forma y el tipo del atributo `nombre`"""
+        actual = getattr(self, nombre)
+        libre = self._reservas.get(nombre)
+        if libre is None or libre.shape != actual.shape or libre.dtype != actual.dtype:
+            libre = np.empty_like(actual)
+            self._reservas[nombre] = libre
+        return libre
+
+    def intercambiar(self, nombre, nuevo):
+        """Pone `nuevo` (su reserva ya escrita) como atributo y guarda el anterior como reserva"""
+        self._reservas[nombre] = getattr(self, nombre)
+        setattr(self, nombre, nuevo)
+
+    @property
+    def num_peces(self):
+        return len(self.posiciones)
+
+    def agregar_columna(self, nombre, dtype=np.uint8, valor=0):
+        self.columnas[nombre] = np.full(self.num_peces, valor, dtype=dtype)
+        return self.columnas[nombre]
 
-# Posiciones y direcciones de los peces
-fish_positions = []
-fish_directions = []
+# Estado por defecto del script
+cardumen = EstadoCardumen(TAMAÑO)
 
-# Posiciones de depredadores y obstáculos
-predator_positions = []
-obstacle_positions = []
+# Índices de la grid para un array (N, 3) de posiciones
+def celdas(posiciones):
+    return tuple(posiciones.T)
+
+def posicion_aleatoria_libre(grid, tamaño):
+    pos = (random.randint(0, tamaño-1), 
+           random.randint(0, tamaño-1), 
+           random.randint(0, tamaño-1))
+    while grid[pos] != EMPTY:
+        pos = (random.randint(0, tamaño-1), 
+               random.randint(0, tamaño-1), 
+               random.randint(0, tamaño-1))
+    return pos
 
 # Inicializar entidades aleatoriamente
-def inicializar_entidades(num_fish, num_predators, num_obstacles):
-    global fish_positions, fish_directions, predator_positions, obstacle_positions
+def inicializar_entidades(num_fish, num_predators, num_obstacles, estado=None):
+    if estado is None:
+        estado = cardumen
+    grid, tamaño = estado.grid, estado.tamaño
     
     # Inicializar peces
+    posiciones = []
+    direcciones = []
     for _ in range(num_fish):
-        pos = (random.randint(0, TAMAÑO-1), 
-               random.randint(0, TAMAÑO-1), 
-               random.randint(0, TAMAÑO-1))
-        while grid[pos] != EMPTY:
-            pos = (random.randint(0, TAMAÑO-1), 
-                   random.randint(0, TAMAÑO-1), 
-                   random.randint(0, TAMAÑO-1))
+        pos = posicion_aleatoria_libre(grid, tamaño)
         grid[pos] = FISH
-        fish_positions.append(pos)
+        estado.indice_peces[pos] = len(posiciones)
+        posiciones.append(pos)
         # Dirección inicial aleatoria
-        fish_directions.append((
+        direcciones.append((
             random.choice([-1, 0, 1]),
             random.choice([-1, 0, 1]),
             random.choice([-1, 0, 1])
         ))
     
     # Inicializar depredadores
+    depredadores = []
     for _ in range(num_predators):
-        pos = (random.randint(0, TAMAÑO-1), 
-               random.randint(0, TAMAÑO-1), 
-               random.randint(0, TAMAÑO-1))
-        while grid[pos] != EMPTY:
-            pos = (random.randint(0, TAMAÑO-1), 
-                   random.randint(0, TAMAÑO-1), 
-                   random.randint(0, TAMAÑO-1))
+        pos = posicion_aleatoria_libre(grid, tamaño)
         grid[pos] = PREDATOR
-        predator_positions.append(pos)
+        depredadores.append(pos)
     
     # Inicializar obstáculos
+    obstaculos = []
     for _ in range(num_obstacles):
-        pos = (random.randint(0, TAMAÑO-1), 
-               random.randint(0, TAMAÑO-1), 
-               random.randint(0, TAMAÑO-1))
-        while grid[pos] != EMPTY:
-            pos = (random.randint(0, TAMAÑO-1), 
-                   random.randint(0, TAMAÑO-1), 
-                   random.randint(0, TAMAÑO-1))
+        pos = posicion_aleatoria_libre(grid, tamaño)
         grid[pos] = OBSTACLE
-        obstacle_positions.append(pos)
-
-# Obtener vecinos en 3D
-def obtener_vecinos_3d(pos, radius):
-    x, y, z = pos
-    vecinos = []
-    for dz in range(-radius, radius+1):
-        for dy in range(-radius, radius+1):
-            for dx in range(-radius, radius+1):
-                if dx == 0 and dy == 0 and dz == 0:
-                    continue
-                nx, ny, nz = (x + dx) % TAMAÑO, (y + dy) % TAMAÑO, (z + dz) % TAMAÑO
-                vecinos.append((nx, ny, nz))
-    return vecinos
+        obstaculos.append(pos)
+    
+    estado.posiciones = np.array(posiciones, dtype=np.int16).reshape(-1, 3)
+    estado.direcciones = np.array(direcciones, dtype=np.int8).reshape(-1, 3)
+    estado.depredadores = np.array(depredadores, dtype=np.int16).reshape(-1, 3)
+    estado.obstaculos = np.array(obstaculos, dtype=np.int16).reshape(-1, 3)
+
+# Obtener vecinos en 3D (cubo de radio `radius`, con vuelta periódica). El
+# orden "F" es el del recorrido dz, dy, dx que usaban estos cálculos
+def obtener_vecinos_3d(pos, radius, tamaño=TAMAÑO):
+    return vecindades.vecinos(pos, radius, tamaño, orden="F")
+
+# Vector unitario hacia cada vecino. Se mide con la coordenada ya envuelta,
+# así que cerca de los bordes se calcula aparte; en el interior coincide con
+# la tabla precalculada
+def unitarios_vecinos(pos, vecinos, radius, tamaño):
+    if vecindades.en_interior(pos, radius, tamaño):
+        return vecindades.distancias(radius, orden="F")[1]
+    desplazamiento = vecinos - pos
+    return desplazamiento / np.sqrt((desplazamiento**2).sum(axis=1))[:, None]
 
 # Calcular vectores de comportamiento
-def calcular_separacion(pos):
+def calcular_separacion(pos, estado):
+    vecinos = obtener_vecinos_3d(pos, SEPARATION_RADIUS, estado.tamaño)
+    ocupados = np.flatnonzero(estado.grid[tuple(vecinos.T)] != EMPTY)
     vector = [0.0, 0.0, 0.0]
-    count = 0
-    
-    for vecino in obtener_vecinos_3d(pos, SEPARATION_RADIUS):
-        if grid[vecino] in [FISH, PREDATOR, OBSTACLE]:
-            dx = vecino[0] - pos[0]
-            dy = vecino[1] - pos[1]
-            dz = vecino[2] - pos[2]
-            dist = max(0.1, np.sqrt(dx**2 + dy**2 + dz**2))
-            vector[0] -= dx / dist
-            vector[1] -= dy / dist
-            vector[2] -= dz / dist
-            count += 1
+    count = len(ocupados)
     
     if count > 0:
+        unitarios = unitarios_vecinos(pos, vecinos, SEPARATION_RADIUS, estado.tamaño)
+        for ux, uy, uz in unitarios[ocupados].tolist():
+            vector[0] -= ux
+            vector[1] -= uy
+            vector[2] -= uz
         vector[0] /= count
         vector[1] /= count
         vector[2] /= count
     
     return vector
 
-def calcular_alineacion(pos, idx):
-    vector = [0.0, 0.0, 0.0]
-    count = 0
-    
-    for vecino in obtener_vecinos_3d(pos, ALIGNMENT_RADIUS):
-        if grid[vecino] == FISH:
-            # Encontrar el pez vecino
-            if vecino in fish_positions:
-                vec_idx = fish_positions.index(vecino)
-                dx, dy, dz = fish_directions[vec_idx]
-                vector[0] += dx
-                vector[1] += dy
-                vector[2] += dz
-                count += 1
+def calcular_alineacion(pos, idx, estado):
+    vecinos = obtener_vecinos_3d(pos, ALIGNMENT_RADIUS, estado.tamaño)
+    peces = vecinos[estado.grid[tuple(vecinos.T)] == FISH]
+    # Encontrar los peces vecinos
+    indices = estado.indice_peces[tuple(peces.T)]
+    indices = indices[indices >= 0]
+    vector = [float(v) for v in estado.direcciones[indices].sum(axis=0, dtype=np.int64)]
+    count = len(indices)
     
     if count > 0:
         magnitude = np.sqrt(vector[0]**2 + vector[1]**2 + vector[2]**2)
@@ -142,21 +210,13 @@ def calcular_alineacion(pos, idx):
     
     return vector
 
-def calcular_cohesion(pos):
-    center = [0.0, 0.0, 0.0]
-    count = 0
-    
-    for vecino in obtener_vecinos_3d(pos, COHESION_RADIUS):
-        if grid[vecino] == FISH:
-            center[0] += vecino[0]
-            center[1] += vecino[1]
-            center[2] += vecino[2]
-            count += 1
+def calcular_cohesion(pos, estado):
+    vecinos = obtener_vecinos_3d(pos, COHESION_RADIUS, estado.tamaño)
+    peces = vecinos[estado.grid[tuple(vecinos.T)] == FISH]
+    count = len(peces)
     
     if count > 0:
-        center[0] /= count
-        center[1] /= count
-        center[2] /= count
+        center = [float(c) / count for c in peces.sum(axis=0)]
         vector = [center[0] - pos[0], center[1] - pos[1], center[2] - pos[2]]
         magnitude = np.sqrt(vector[0]**2 + vector[1]**2 + vector[2]**2)
         if magnitude > 0:
@@ -167,27 +227,26 @@ def calcular_cohesion(pos):
     
     return [0.0, 0.0, 0.0]
 
-def calcular_huida(pos):
+def calcular_huida(pos, estado):
+    vecinos = obtener_vecinos_3d(pos, FLEE_RADIUS, estado.tamaño)
+    depredadores = np.flatnonzero(estado.grid[tuple(vecinos.T)] == PREDATOR)
     vector = [0.0, 0.0, 0.0]
     
-    for vecino in obtener_vecinos_3d(pos, FLEE_RADIUS):
-        if grid[vecino] == PREDATOR:
-            dx = vecino[0] - pos[0]
-            dy = vecino[1] - pos[1]
-            dz = vecino[2] - pos[2]
-            dist = max(1.0, np.sqrt(dx**2 + dy**2 + dz**2))
-            vector[0] -= dx / dist
-            vector[1] -= dy / dist
-            vector[2] -= dz / dist
+    if len(depredadores):
+        unitarios = unitarios_vecinos(pos, vecinos, FLEE_RADIUS, estado.tamaño)
+        for ux, uy, uz in unitarios[depredadores].tolist():
+            vector[0] -= ux
+            vector[1] -= uy
+            vector[2] -= uz
     
     return vector
 
 # Calcular nueva dirección para un pez
-def calcular_nueva_direccion(pos, idx):
-    sep_vec = calcular_separacion(pos)
-    ali_vec = calcular_alineacion(pos, idx)
-    coh_vec = calcular_cohesion(pos)
-    flee_vec = calcular_huida(pos)
+def calcular_nueva_direccion(pos, idx, estado):
+    sep_vec = calcular_separacion(pos, estado)
+    ali_vec = calcular_alineacion(pos, idx, estado)
+    coh_vec = calcular_cohesion(pos, estado)
+    flee_vec = calcular_huida(pos, estado)
     
     total_vec = [
         SEPARATION_WEIGHT * sep_vec[0] + 
@@ -220,159 +279,173 @@ def calcular_nueva_direccion(pos, idx):
     
     # Si no hay dirección clara, mantener la anterior
     if new_dir == [0, 0, 0]:
-        return fish_directions[idx]
+        return estado.direcciones[idx].tolist()
     
     return new_dir
 
 # Mover depredadores de forma aleatoria
-def mover_depredadores():
-    global predator_positions
-    
-    new_predator_positions = []
-    for pos in predator_positions:
-        # Intentar moverse en dirección aleatoria
-        dx, dy, dz = random.choice([
-            (d[0], d[1], d[2]) for d in [
-                (-1,0,0), (1,0,0), (0,-1,0), (0,1,0), (0,0,-1), (0,0,1),
-                (-1,-1,0), (-1,1,0), (1,-1,0), (1,1,0),
-                (-1,0,-1), (-1,0,1), (1,0,-1), (1,0,1),
-                (0,-1,-1), (0,-1,1), (0,1,-1), (0,1,1)
-            ] if d != (0,0,0)
-        ])
-        
-        new_pos = (
-            (pos[0] + dx) % TAMAÑO,
-            (pos[1] + dy) % TAMAÑO,
-            (pos[2] + dz) % TAMAÑO
-        )
-        
-        # Solo moverse si la nueva posición está vacía
+def mover_depredadores(estado=None):
+    if estado is None:
+        estado = cardumen
+    grid, tamaño = estado.grid, estado.tamaño
+    perfil = estado.perfil
+    perfil.iniciar("mover_depredadores")
+    
+    # Sortear una dirección por depredador y calcular los destinos en bloque
+    pasos = np.array([random.choice(DIRECCIONES_DEPREDADOR)
+                      for _ in range(len(estado.depredadores))], dtype=np.int16).reshape(-1, 3)
+    destinos = (estado.depredadores + pasos) % tamaño
+    perfil.fase("sorteo")
+    
+    # Los conflictos se resuelven en orden: solo moverse si la nueva posición está vacía
+    nuevas = estado.depredadores.copy()
+    for i, (pos, new_pos) in enumerate(zip(map(tuple, estado.depredadores.tolist()),
+                                           map(tuple, destinos.tolist()))):
         if grid[new_pos] == EMPTY:
             grid[pos] = EMPTY
             grid[new_pos] = PREDATOR
-            new_predator_positions.append(new_pos)
-        else:
-            new_predator_positions.append(pos)
+            nuevas[i] = new_pos
     
-    predator_positions = new_predator_positions
+    estado.depredadores = nuevas
+    perfil.fase("movimientos")
+    perfil.terminar(depredadores=len(nuevas))
+
+# Anotar un pez en el índice. Si dos peces acaban en la misma celda se queda
+# el de menor índice
+def registrar_pez(indice_peces, pos, idx):
+    if indice_peces[pos] < 0:
+        indice_peces[pos] = idx
 
 # Simular un paso completo
-def simular_paso():
-    global fish_positions, fish_directions, grid
+def simular_paso(estado=None, grabador=None):
+    """Avanza un paso; si se pasa un grabador (trayectorias.Grabador) le agrega la grid nueva"""
+    if estado is None:
+        estado = cardumen
+    tamaño = estado.tamaño
+    indice_peces = estado.indice_peces
+    perfil = estado.perfil
+    perfil.iniciar("simular_paso")
+    fish_positions = list(map(tuple, estado.posiciones.tolist()))
     
     # Calcular nuevas direcciones para todos los peces
-    new_directions = []
-    for idx, pos in enumerate(fish_positions):
-        new_directions.append(calcular_nueva_direccion(pos, idx))
+    fish_directions = [calcular_nueva_direccion(pos, idx, estado)
+                       for idx, pos in enumerate(fish_positions)]
     
     # Actualizar direcciones
-    fish_directions = new_directions
-    
-    # Crear nueva grid temporal
-    new_grid = np.copy(grid)
-    for pos in fish_positions:
-        new_grid[pos] = EMPTY
+    nuevas_direcciones = estado.reserva("direcciones")
+    nuevas_direcciones[:] = np.reshape(fish_directions, (-1, 3))
+    estado.intercambiar("direcciones", nuevas_direcciones)
+    perfil.fase("direcciones")
+    
+    # Grid siguiente sobre la reserva
+    new_grid = estado.reserva("grid")
+    np.copyto(new_grid, estado.grid)
+    new_grid[celdas(estado.posiciones)] = EMPTY
+    indice_peces[celdas(estado.posiciones)] = -1
+    perfil.fase("grid")
     
     # Mover peces
-    new_fish_positions = []
-    for idx, pos in enumerate(fish_positions):
-        dx, dy, dz = fish_directions[idx]
-        new_pos = (
-            (pos[0] + dx) % TAMAÑO,
-            (pos[1] + dy) % TAMAÑO,
-            (pos[2] + dz) % TAMAÑO
-        )
+    new_fish_positions = estado.reserva("posiciones")
+    if estado.motor_movimiento == "numba":
+        nucleos.mover_peces_3d(new_grid, indice_peces, estado.posiciones, estado.direcciones,
+                               new_fish_positions)
+    else:
+        for idx, pos in enumerate(fish_positions):
+            dx, dy, dz = fish_directions[idx]
+            new_pos = (
+                (pos[0] + dx) % tamaño,
+                (pos[1] + dy) % tamaño,
+                (pos[2] + dz) % tamaño
+            )
         
-        # Si la nueva posición está vacía, mover
-        if new_grid[new_pos] == EMPTY:
-            new_grid[new_pos] = FISH
-            new_fish_positions.append(new_pos)
-        else:
-            # Intentar moverse en una dirección alternativa
-            moved = False
-            directions_to_try = [
-                (dx, dy, dz),  # Primero intentar la dirección original
-                (dx, dy, 0), (dx, 0, dz), (0, dy, dz),
-                (dx, 0, 0), (0, dy, 0), (0, 0, dz),
-                (-dx, dy, dz), (dx, -dy, dz), (dx, dy, -dz)
-            ]
+            # Si la nueva posición está vacía, mover
+            if new_grid[new_pos] == EMPTY:
+                new_grid[new_pos] = FISH
+                registrar_pez(indice_peces, new_pos, idx)
+                new_fish_positions[idx] = new_pos
+            else:
+                # Intentar moverse en una dirección alternativa
+                moved = False
+                directions_to_try = [
+                    (dx, dy, dz),  # Primero intentar la dirección original
+                    (dx, dy, 0), (dx, 0, dz), (0, dy, dz),
+                    (dx, 0, 0), (0, dy, 0), (0, 0, dz),
+                    (-dx, dy, dz), (dx, -dy, dz), (dx, dy, -dz)
+                ]
             
-            for d in directions_to_try:
-                alt_pos = (
-                    (pos[0] + d[0]) % TAMAÑO,
-                    (pos[1] + d[1]) % TAMAÑO,
-                    (pos[2] + d[2]) % TAMAÑO
-                )
-                if new_grid[alt_pos] == EMPTY:
-                    new_grid[alt_pos] = FISH
-                    new_fish_positions.append(alt_pos)
-                    moved = True
-                    break
+                for d in directions_to_try:
+                    alt_pos = (
+                        (pos[0] + d[0]) % tamaño,
+                        (pos[1] + d[1]) % tamaño,
+                        (pos[2] + d[2]) % tamaño
+                    )
+                    if new_grid[alt_pos] == EMPTY:
+                        new_grid[alt_pos] = FISH
+                        registrar_pez(indice_peces, alt_pos, idx)
+                        new_fish_positions[idx] = alt_pos
+                        moved = True
+                        break
             
-            # Si no se pudo mover, permanecer en la posición actual
-            if not moved:
-                new_grid[pos] = FISH
-                new_fish_positions.append(pos)
+                # Si no se pudo mover, permanecer en la posición actual
+                if not moved:
+                    new_grid[pos] = FISH
+                    registrar_pez(indice_peces, pos, idx)
+                    new_fish_positions[idx] = pos
     
-    # Actualizar depredadores
-    mover_depredadores()
+    # Actualizar estado
+    estado.intercambiar("posiciones", new_fish_positions)
+    estado.intercambiar("grid", new_grid)
+    perfil.fase("movimientos")
     
-    # Actualizar estado global
-    fish_positions = new_fish_positions
-    grid = new_grid
+    # Actualizar depredadores sobre la grid nueva
+    mover_depredadores(estado)
+    perfil.fase("depredadores")
     
     # Mantener obstáculos
-    for pos in obstacle_positions:
-        grid[pos] = OBSTACLE
+    new_grid[celdas(estado.obstaculos)] = OBSTACLE
+
+    if grabador is not None:
+        grabador.agregar(estado.grid)
+    perfil.fase("grabacion")
+    perfil.terminar(peces=estado.num_peces, depredadores=len(estado.depredadores))
 
-# Visualización 3D
-def visualizar_3d(paso):
+# Coordenadas (xs, ys, zs) de cada tipo de entidad, directamente de los
+# arrays de entidades sin recorrer la grid
+def coordenadas_entidades(estado):
+    return {
+        FISH: tuple(estado.posiciones.T),
+        PREDATOR: tuple(estado.depredadores.T),
+        OBSTACLE: tuple(estado.obstaculos.T),
+    }
+
+# Título de los visores, con el lado de los bloques si se agruparon
+def titulo(paso, lado):
+    texto = f'Simulación de Cardumen 3D - Paso: {paso}'
+    if lado > 1:
+        texto += f' (bloques de {lado}³)'
+    return texto
+
+# Visualización 3D. Con más de `presupuesto` entidades se dibujan agrupadas
+# en bloques (ver instantaneas.detalle)
+def visualizar_3d(paso, estado=None, presupuesto=instantaneas.PRESUPUESTO):
+    if estado is None:
+        estado = cardumen
+    tamaño = estado.tamaño
     fig = plt.figure(figsize=(12, 10))
     ax = fig.add_subplot(111, projection='3d')
     
-    # Preparar datos para visualización
-    peces = [[], [], []]
-    depredadores = [[], [], []]
-    obstaculos = [[], [], []]
-    
-    # Recopilar coordenadas
-    for z in range(TAMAÑO):
-        for y in range(TAMAÑO):
-            for x in range(TAMAÑO):
-                if grid[x, y, z] == FISH:
-                    peces[0].append(x)
-                    peces[1].append(y)
-                    peces[2].append(z)
-                elif grid[x, y, z] == PREDATOR:
-                    depredadores[0].append(x)
-                    depredadores[1].append(y)
-                    depredadores[2].append(z)
-                elif grid[x, y, z] == OBSTACLE:
-                    obstaculos[0].append(x)
-                    obstaculos[1].append(y)
-                    obstaculos[2].append(z)
-    
     # Crear scatter plots
-    if peces[0]:
-        ax.scatter(peces[0], peces[1], peces[2], 
-                   c='cyan', s=20, alpha=0.7, label='Peces', depthshade=True)
-    
-    if depredadores[0]:
-        ax.scatter(depredadores[0], depredadores[1], depredadores[2], 
-                   c='red', s=50, alpha=0.9, label='Depredadores', depthshade=True)
-    
-    if obstaculos[0]:
-        ax.scatter(obstaculos[0], obstaculos[1], obstaculos[2], 
-                   c='gray', s=40, alpha=0.5, label='Obstáculos', depthshade=True)
+    visibles, tamaños, lado = instantaneas.detalle(coordenadas_entidades(estado), ESTILOS, presupuesto)
+    instantaneas.artistas(ax, ESTILOS, visibles, tamaños)
     
     # Configuración del gráfico
-    ax.set_title(f'Simulación de Cardumen 3D - Paso: {paso}', fontsize=14)
+    ax.set_title(titulo(paso, lado), fontsize=14)
     ax.set_xlabel('X')
     ax.set_ylabel('Y')
     ax.set_zlabel('Z')
-    ax.set_xlim(0, TAMAÑO)
-    ax.set_ylim(0, TAMAÑO)
-    ax.set_zlim(0, TAMAÑO)
+    ax.set_xlim(0, tamaño)
+    ax.set_ylim(0, tamaño)
+    ax.set_zlim(0, tamaño)
     
     # Leyenda
     ax.legend(loc='upper right')
@@ -385,7 +458,10 @@ def visualizar_3d(paso):
     plt.pause(0.5)  # Mantener la ventana abierta medio segundo por paso
     plt.close()
 
-def visualizar_3d_animado():
+def visualizar_3d_animado(estado=None, pasos=PASOS, presupuesto=instantaneas.PRESUPUESTO):
+    if estado is None:
+        estado = cardumen
+    tamaño = estado.tamaño
     fig = plt.figure(figsize=(12, 10))
     ax = fig.add_subplot(111, projection='3d')
     #ax.set_facecolor((0/255, 20/255, 50/255))  # Azul marino oscuro
@@ -399,45 +475,79 @@ def visualizar_3d_animado():
     ax.set_xlabel('X')
     ax.set_ylabel('Y')
     ax.set_zlabel('Z')
-    ax.set_xlim(0, TAMAÑO)
-    ax.set_ylim(0, TAMAÑO)
-    ax.set_zlim(0, TAMAÑO)
+    ax.set_xlim(0, tamaño)
+    ax.set_ylim(0, tamaño)
+    ax.set_zlim(0, tamaño)
     ax.view_init(elev=30, azim=45)
     plt.tight_layout()
 
-    peces_scatter = ax.scatter([], [], [], c='cyan', s=20, alpha=0.7, label='Peces', depthshade=True)
-    depredadores_scatter = ax.scatter([], [], [], c='red', s=50, alpha=0.9, label='Depredadores', depthshade=True)
-    obstaculos_scatter = ax.scatter([], [], [], c='gray', s=40, alpha=0.5, label='Obstáculos', depthshade=True)
+    artistas = instantaneas.artistas(ax, ESTILOS)
     ax.legend(loc='upper right')
 
-    for paso in range(PASOS):
-        simular_paso()
-        peces = [[], [], []]
-        depredadores = [[], [], []]
-        obstaculos = [[], [], []]
-        for z in range(TAMAÑO):
-            for y in range(TAMAÑO):
-                for x in range(TAMAÑO):
-                    if grid[x, y, z] == FISH:
-                        peces[0].append(x)
-                        peces[1].append(y)
-                        peces[2].append(z)
-                    elif grid[x, y, z] == PREDATOR:
-                        depredadores[0].append(x)
-                        depredadores[1].append(y)
-                        depredadores[2].append(z)
-                    elif grid[x, y, z] == OBSTACLE:
-                        obstaculos[0].append(x)
-                        obstaculos[1].append(y)
-                        obstaculos[2].append(z)
-        peces_scatter._offsets3d = (peces[0], peces[1], peces[2])
-        depredadores_scatter._offsets3d = (depredadores[0], depredadores[1], depredadores[2])
-        obstaculos_scatter._offsets3d = (obstaculos[0], obstaculos[1], obstaculos[2])
-        ax.set_title(f'Simulación de Cardumen 3D - Paso: {paso+1}', fontsize=14)
+    for paso in range(pasos):
+        perfil = estado.perfil
+        perfil.iniciar("cuadro")
+        simular_paso(estado)
+        perfil.fase("paso")
+        visibles, tamaños, lado = instantaneas.detalle(coordenadas_entidades(estado), ESTILOS, presupuesto)
+        instantaneas.actualizar(artistas, visibles, tamaños)
+        ax.set_title(titulo(paso + 1, lado), fontsize=14)
+        perfil.fase("artistas")
         plt.pause(0.2)
+        perfil.fase("dibujo")
+        perfil.terminar()
     plt.show()
 
-if __name__ == "__main__":
+def reproducir(ruta, presupuesto=instantaneas.PRESUPUESTO):
+    """Visor de una grabación del cardumen, con deslizador para saltar de paso"""
+    lector = trayectorias.Lector(ruta)
+    tamaño = lector.forma[0]
+    fig = plt.figure(figsize=(12, 10))
+    ax = fig.add_subplot(111, projection='3d')
+    ax.xaxis.set_pane_color((100/255, 150/255, 200/255, 1.0))
+    ax.yaxis.set_pane_color((100/255, 150/255, 200/255, 1.0))
+    ax.zaxis.set_pane_color((100/255, 150/255, 200/255, 1.0))
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    ax.set_xlim(0, tamaño)
+    ax.set_ylim(0, tamaño)
+    ax.set_zlim(0, tamaño)
+    ax.view_init(elev=30, azim=45)
+
+    artistas = instantaneas.artistas(ax, ESTILOS)
+    ax.legend(loc='upper right')
+
+    def actualizar(paso, grid):
+        # La grabación solo tiene la grid: una pasada para los tres tipos
+        coords = instantaneas.coordenadas(grid, ESTILOS)
+        visibles, tamaños, lado = instantaneas.detalle(coords, ESTILOS, presupuesto)
+        instantaneas.actualizar(artistas, visibles, tamaños)
+        ax.set_title(titulo(paso, lado), fontsize=14)
+
+    trayectorias.reproducir_matplotlib(lector, fig, actualizar)
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulación 3D de cardumen")
+    parser.add_argument("--pasos", type=int, default=PASOS)
+    parser.add_argument("--grabar", metavar="ARCHIVO",
+                        help="simula sin ventana y graba la trayectoria en un .npz")
+    parser.add_argument("--reproducir", metavar="ARCHIVO", help="reproduce una grabación sin simular")
+    parser.add_argument("--perfil", metavar="ARCHIVO",
+                        help="mide cada fase del paso; escribe un registro JSON por línea")
+    parser.add_argument("--puntos", type=int, default=instantaneas.PRESUPUESTO,
+                        help="máximo de puntos por cuadro; con más entidades se agrupan en bloques (0: sin límite)")
+    args = parser.parse_args()
+    if args.puntos < 0:
+        parser.error("--puntos no puede ser negativo")
+    presupuesto = args.puntos or None
+
+    if args.reproducir:
+        reproducir(args.reproducir, presupuesto)
+        return
+    if args.perfil:
+        cardumen.perfil = perfilado.Perfil(archivo=args.perfil)
+
     # Parámetros de la simulación
     NUM_FISH = 100
     NUM_PREDATORS = 5
@@ -446,9 +556,21 @@ if __name__ == "__main__":
     # Inicializar simulación
     print("Inicializando simulación 3D de cardumen...")
     inicializar_entidades(NUM_FISH, NUM_PREDATORS, NUM_OBSTACLES)
-    print(f"Peces: {len(fish_positions)}, Depredadores: {len(predator_positions)}, Obstáculos: {len(obstacle_positions)}")
+    print(f"Peces: {cardumen.num_peces}, Depredadores: {len(cardumen.depredadores)}, Obstáculos: {len(cardumen.obstaculos)}")
 
     # Bucle principal de simulación
     print("Iniciando simulación...")
-    visualizar_3d_animado()
-    print("Simulación completada!")
\ No newline at end of file
+    if args.grabar:
+        with trayectorias.Grabador(args.grabar) as grabador:
+            grabador.agregar(cardumen.grid)
+            for paso in range(args.pasos):
+                simular_paso(cardumen, grabador)
+        print(f"Trayectoria grabada en {args.grabar}")
+    else:
+        visualizar_3d_animado(pasos=args.pasos, presupuesto=presupuesto)
+    cardumen.perfil.informe()
+    cardumen.perfil.cerrar()
+    print("Simulación completada!")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,23 @@
+import argparse
+import csv
 import numpy as np
 import math
+import os
 import random
-import pygame
 import sys
+import threading
+import time
+
+import nucleos
+import perfilado
+import trayectorias
+
+# pygame solo se importa al crear un SimulationVisualizer (ver _import_pygame),
+# así el autómata y el modo sin ventana no dependen de él
+pygame = None
+
+# Los GIF se buscan junto al script, no en el directorio actual
+ASSETS_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Constantes de configuración
 EMPTY = 0
@@ -32,34 +47,236 @@ ALIGNMENT_RADIUS = 2
 COHESION_RADIUS = 2
 FLEE_RADIUS = 3
 
+# Tipo de la grilla: dos planos de int8 por celda (tipo y dirección, -1 si
+# no es un pez), 2 bytes por celda en lugar de 16 con int64
+GRID_DTYPE = np.int8
+
+# Motores disponibles para calcular las direcciones de cada paso
+ENGINES = ("scalar", "vectorized")
+
+# Modos de dibujo: toda la pantalla en cada cuadro, solo las celdas que
+# cambian o el plano de tipos pasado por una paleta en un solo array
+RENDER_MODES = ("full", "dirty", "array")
+
+# En el modo "array", con celdas más pequeñas que esto los sprites no se
+# distinguen y cada pez o depredador es solo una celda de su color
+SPRITE_MIN_CELL_SIZE = 8
+
+# Tamaño máximo de la ventana: en océanos más grandes se ve la parte que
+# enfoca la cámara
+MAX_WINDOW_SIZE = (1600, 1000)
+
+# Límites del zoom: píxeles por celda al acercar y celdas por lado de cada
+# mosaico de densidad al alejar
+MAX_CELL_SIZE = 64
+MAX_TILE = 16
+
+# Conteo de los mosaicos de densidad: cada tipo suma 1 en su campo de 10 bits
+# de un uint32 (peces, depredadores, obstáculos), así que un mosaico de hasta
+# MAX_TILE² celdas se cuenta con una sola suma
+TILE_COUNT_CODES = np.array([0, 1, 1 << 10, 1 << 20], dtype=np.uint32)
+
+# Componentes de DIRECTIONS como arrays para indexar en bloque
+DIRECTION_DX = np.array([d[0] for d in DIRECTIONS])
+DIRECTION_DY = np.array([d[1] for d in DIRECTIONS])
+
+
+def _neighbor_offsets(radius):
+    # Mismo orden que get_neighbors (dy por fuera, dx por dentro)
+    return [(dx, dy)
+            for dy in range(-radius, radius + 1)
+            for dx in range(-radius, radius + 1)
+            if dx != 0 or dy != 0]
+
+
+def direction_field(types, directions, weights=None, out=None, row_origin=0, wrap_height=None):
+    """Calcula la nueva dirección de todos los peces de la grilla a la vez.
+
+    Equivale a llamar calculate_new_direction en cada celda: recorre los
+    vecinos en el mismo orden y acumula con las mismas operaciones, así que
+    el campo resultante coincide con el del motor escalar. Las celdas que no
+    son peces quedan en -1.
+
+    types y directions pueden llevar ejes iniciales extra (varios mundos
+    apilados). weights es (separación, alineación, cohesión, huida); cada
+    peso puede ser un escalar o un array con la forma de esos ejes extra.
+    Con `out` (un array entero con la forma de types) el campo se escribe ahí.
+
+    Para una franja de un océano más alto, row_origin es la fila global de
+    la primera fila de types y wrap_height la altura total: las coordenadas
+    (y su vuelta toroidal) se calculan como en la grilla completa. Solo son
+    válidas las filas que distan al menos FLEE_RADIUS del borde de la franja.
+    """
+    height, width = types.shape[-2:]
+    if wrap_height is None:
+        wrap_height = height
+    pad = max(SEPARATION_RADIUS, ALIGNMENT_RADIUS, COHESION_RADIUS, FLEE_RADIUS)
+    pad_width = [(0, 0)] * (types.ndim - 2) + [(pad, pad), (pad, pad)]
+    padded_types = np.pad(types, pad_width, mode="wrap")
+    padded_occupied = padded_types != EMPTY
+    padded_fish = padded_types == FISH
+    padded_predator = padded_types == PREDATOR
+    shape, size = types.shape, types.size
+    flat_dirs = directions.reshape(-1)
+    fish = types == FISH
+
+    def neighbors(padded_mask, dx, dy):
+        # Índices planos de los peces cuyo vecino (dx, dy) cumple la máscara,
+        # con las coordenadas del vecino ya envueltas como en get_neighbors
+        view = padded_mask[..., pad + dy:pad + dy + height, pad + dx:pad + dx + width]
+        cells = np.flatnonzero(view & fish)
+        x, y = cells % width, cells // width % height
+        nx, local_y = (x + dx) % width, (y + dy) % height
+        global_y = (y + row_origin) % wrap_height
+        ny = (global_y + dy) % wrap_height
+        return cells, x, global_y, nx, ny, cells + (local_y - y) * width + (nx - x)
+
+    # Separación
+    sep_x, sep_y = np.zeros(size), np.zeros(size)
+    sep_count = np.zeros(size, dtype=int)
+    for dx, dy in _neighbor_offsets(SEPARATION_RADIUS):
+        cells, x, y, nx, ny, _ = neighbors(padded_occupied, dx, dy)
+        ddx, ddy = nx - x, ny - y
+        dist = np.maximum(0.1, np.sqrt(ddx**2 + ddy**2))
+        sep_x[cells] -= ddx / dist
+        sep_y[cells] -= ddy / dist
+        sep_count[cells] += 1
+    np.divide(sep_x, sep_count, out=sep_x, where=sep_count > 0)
+    np.divide(sep_y, sep_count, out=sep_y, where=sep_count > 0)
+
+    # Alineación
+    ali_x, ali_y = np.zeros(size), np.zeros(size)
+    ali_count = np.zeros(size, dtype=int)
+    for dx, dy in _neighbor_offsets(ALIGNMENT_RADIUS):
+        cells, x, y, nx, ny, neighbor_cells = neighbors(padded_fish, dx, dy)
+        neighbor_dirs = flat_dirs[neighbor_cells]
+        ali_x[cells] += DIRECTION_DX[neighbor_dirs]
+        ali_y[cells] += DIRECTION_DY[neighbor_dirs]
+        ali_count[cells] += 1
+    magnitude = np.sqrt(ali_x**2 + ali_y**2)
+    normalize = (ali_count > 0) & (magnitude > 0)
+    np.divide(ali_x, magnitude, out=ali_x, where=normalize)
+    np.divide(ali_y, magnitude, out=ali_y, where=normalize)
+
+    # Cohesión
+    center_x, center_y = np.zeros(size), np.zeros(size)
+    coh_count = np.zeros(size, dtype=int)
+    for dx, dy in _neighbor_offsets(COHESION_RADIUS):
+        cells, x, y, nx, ny, _ = neighbors(padded_fish, dx, dy)
+        center_x[cells] += nx
+        center_y[cells] += ny
+        coh_count[cells] += 1
+
+    # Huida
+    flee_x, flee_y = np.zeros(size), np.zeros(size)
+    for dx, dy in _neighbor_offsets(FLEE_RADIUS):
+        cells, x, y, nx, ny, _ = neighbors(padded_predator, dx, dy)
+        ddx, ddy = nx - x, ny - y
+        dist = np.maximum(1.0, np.sqrt(ddx**2 + ddy**2))
+        flee_x[cells] -= ddx / dist
+        flee_y[cells] -= ddy / dist
+
+    # El resto solo importa en las celdas con pez. La magnitud de la cohesión
+    # y el ángulo se calculan con math (pow y atan2 de la libm) porque los de
+    # NumPy difieren en el último bit y cambiarían el sector en los empates.
+    fish_cells = np.flatnonzero(fish)
+    fish_x = fish_cells % width
+    fish_y = (fish_cells // width % height + row_origin) % wrap_height
+    count = coh_count[fish_cells]
+    has_fish = count > 0
+    safe_count = np.maximum(count, 1)
+    coh_x = np.where(has_fish, center_x[fish_cells] / safe_count - fish_x, 0.0)
+    coh_y = np.where(has_fish, center_y[fish_cells] / safe_count - fish_y, 0.0)
+    magnitude = np.fromiter(map(_magnitude, coh_x.tolist(), coh_y.tolist()),
+                            dtype=float, count=len(coh_x))
+    np.divide(coh_x, magnitude, out=coh_x, where=magnitude > 0)
+    np.divide(coh_y, magnitude, out=coh_y, where=magnitude > 0)
+
+    # Combinar vectores con pesos (por pez si cada mundo tiene los suyos)
+    if weights is None:
+        weights = (SEPARATION_WEIGHT, ALIGNMENT_WEIGHT, COHESION_WEIGHT, FLEE_WEIGHT)
+    world = fish_cells // (height * width)
+    sep_w, ali_w, coh_w, flee_w = (
+        np.broadcast_to(w, shape[:-2]).reshape(-1)[world] if np.ndim(w) else w
+        for w in weights)
+    total_x = (sep_w * sep_x[fish_cells] + ali_w * ali_x[fish_cells] +
+               coh_w * coh_x + flee_w * flee_x[fish_cells])
+    total_y = (sep_w * sep_y[fish_cells] + ali_w * ali_y[fish_cells] +
+               coh_w * coh_y + flee_w * flee_y[fish_cells])
+
+    # Convertir vector a dirección (sin vector se mantiene la actual)
+    angle = np.fromiter(map(math.atan2, total_y.tolist(), total_x.tolist()),
+                        dtype=float, count=len(total_x))
+    sector = np.rint(angle / (2 * math.pi / 8)).astype(int) % 8
+    keep = (total_x == 0) & (total_y == 0)
+    if out is None:
+        out = np.empty(shape, dtype=int)
+    new_directions = out.reshape(-1)
+    new_directions.fill(-1)
+    new_directions[fish_cells] = np.where(keep, flat_dirs[fish_cells], sector)
+    return out
+
+
+def _magnitude(x, y):
+    return math.sqrt(x**2 + y**2)
+
+
 class CellularAutomaton:
-    def __init__(self, width, height, num_fish, num_predators, num_obstacles):
+    def __init__(self, width, height, num_fish, num_predators, num_obstacles,
+                 engine="scalar", seed=None, move_backend=None):
+        if engine not in ENGINES:
+            raise ValueError(f"Motor desconocido: {engine!r} (opciones: {', '.join(ENGINES)})")
         self.width = width
         self.height = height
-        self.grid = np.zeros((height, width, 2), dtype=int)  # su [tipo, dirección]
+        self.engine = engine
+        # Resolución de movimientos: "numba" (nucleos.py) si está instalado,
+        # si no el bucle en Python. Los dos dan la misma grilla
+        self.move_backend = nucleos.elegir(move_backend)
+        # Con semilla cada autómata tiene su propio generador; sin ella se
+        # usa el módulo random global como siempre
+        self.rng = random.Random(seed) if seed is not None else random
+        self.grid = np.zeros((height, width, 2), dtype=GRID_DTYPE)  # su [tipo, dirección]
+        # Búferes que se reutilizan en cada update: la grilla siguiente (se
+        # intercambia con grid) y el campo de direcciones
+        self._back = np.zeros_like(self.grid)
+        self._directions = np.full((height, width), -1, dtype=GRID_DTYPE)
+        # Grabador opcional (trayectorias.Grabador): recibe la grilla tras cada update
+        self.recorder = None
+        # Perfil (perfilado.Perfil) que mide cada fase de update; NULO no mide nada
+        self.profiler = perfilado.NULO
         self.initialize_random(num_fish, num_predators, num_obstacles)
         
+    @property
+    def types(self):
+        """Plano de tipos de celda (vista de grid)"""
+        return self.grid[:, :, 0]
+
+    @property
+    def directions(self):
+        """Plano de direcciones, -1 donde no hay pez (vista de grid)"""
+        return self.grid[:, :, 1]
+
     def initialize_random(self, num_fish, num_predators, num_obstacles):
         # Inicio de lso peces sapos
         for _ in range(num_fish):
-            x, y = random.randint(0, self.width-1), random.randint(0, self.height-1)
+            x, y = self.rng.randint(0, self.width-1), self.rng.randint(0, self.height-1)
             while self.grid[y, x, 0] != EMPTY:
-                x, y = random.randint(0, self.width-1), random.randint(0, self.height-1)
-            direction = random.randint(0, 7)
+                x, y = self.rng.randint(0, self.width-1), self.rng.randint(0, self.height-1)
+            direction = self.rng.randint(0, 7)
             self.grid[y, x] = [FISH, direction]
         
         # Inicializar depredadores
         for _ in range(num_predators):
-            x, y = random.randint(0, self.width-1), random.randint(0, self.height-1)
+            x, y = self.rng.randint(0, self.width-1), self.rng.randint(0, self.height-1)
             while self.grid[y, x, 0] != EMPTY:
-                x, y = random.randint(0, self.width-1), random.randint(0, self.height-1)
+                x, y = self.rng.randint(0, self.width-1), self.rng.randint(0, self.height-1)
             self.grid[y, x] = [PREDATOR, -1]
         
         # Inicializar obstáculos
         for _ in range(num_obstacles):
-            x, y = random.randint(0, self.width-1), random.randint(0, self.height-1)
+            x, y = self.rng.randint(0, self.width-1), self.rng.randint(0, self.height-1)
             while self.grid[y, x, 0] != EMPTY:
-                x, y = random.randint(0, self.width-1), random.randint(0, self.height-1)
+                x, y = self.rng.randint(0, self.width-1), self.rng.randint(0, self.height-1)
             self.grid[y, x] = [OBSTACLE, -1]
     
     def get_neighbors(self, x, y, radius):
@@ -184,69 +401,281 @@ class CellularAutomaton:
         sector = int(round(angle / (2 * math.pi / 8)) % 8)
         return sector
     
-    def update(self):
-        # Paso 1: Calcular nuevas direcciones
-        new_directions = np.full((self.height, self.width), -1)
+    def compute_directions(self):
+        if self._directions.shape != self.grid.shape[:2]:
+            self._directions = np.full(self.grid.shape[:2], -1, dtype=GRID_DTYPE)
+        if self.engine == "vectorized":
+            return direction_field(self.types, self.directions, out=self._directions)
+
+        new_directions = self._directions
+        new_directions.fill(-1)
         for y in range(self.height):
             for x in range(self.width):
                 if self.grid[y, x, 0] == FISH:
                     new_directions[y, x] = self.calculate_new_direction(x, y)
+        return new_directions
+
+    def update(self):
+        profiler = self.profiler
+        profiler.iniciar("update")
+
+        # Paso 1: Calcular nuevas direcciones
+        new_directions = self.compute_directions()
+        profiler.fase("directions")
         
-        # Paso 2: Crear nueva grilla y copiar elementos estáticos
-        new_grid = np.zeros((self.height, self.width, 2), dtype=int)
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.grid[y, x, 0] in [PREDATOR, OBSTACLE]:
-                    new_grid[y, x] = self.grid[y, x]
+        # Paso 2: Vaciar la grilla de reserva y copiar elementos estáticos.
+        # grid y _back se turnan, así que quien quiera conservar una grilla
+        # de un paso anterior debe copiarla
+        if self._back.shape != self.grid.shape or self._back.dtype != self.grid.dtype:
+            self._back = np.empty_like(self.grid)
+        new_grid = self._back
+        new_grid.fill(EMPTY)
+        static = np.isin(self.types, [PREDATOR, OBSTACLE])
+        new_grid[static] = self.grid[static]
+        profiler.fase("copy")
         
-        # Paso 3: Mover peces en orden aleatorio
-        fish_positions = []
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.grid[y, x, 0] == FISH:
-                    fish_positions.append((x, y))
+        # Paso 3: Mover peces en orden aleatorio (np.nonzero recorre por filas,
+        # igual que el doble bucle y, x)
+        fish_ys, fish_xs = np.nonzero(self.types == FISH)
+
+        if self.move_backend == "numba":
+            # shuffle solo depende de la longitud: barajar los índices da la
+            # misma permutación que barajar la lista de posiciones
+            order = list(range(len(fish_xs)))
+            self.rng.shuffle(order)
+            profiler.fase("shuffle")
+            nucleos.mover_peces_2d(new_grid, new_directions, fish_xs[order], fish_ys[order],
+                                   DIRECTION_DX, DIRECTION_DY)
+        else:
+            fish_positions = list(zip(fish_xs.tolist(), fish_ys.tolist()))
         
-        random.shuffle(fish_positions)
+            self.rng.shuffle(fish_positions)
+            profiler.fase("shuffle")
         
-        for x, y in fish_positions:
-            new_dir = new_directions[y, x]
-            dx, dy = DIRECTIONS[new_dir]
-            new_x, new_y = (x + dx) % self.width, (y + dy) % self.height
+            for x, y in fish_positions:
+                new_dir = new_directions[y, x]
+                dx, dy = DIRECTIONS[new_dir]
+                new_x, new_y = (x + dx) % self.width, (y + dy) % self.height
             
-            # Intentar mover a la dirección deseada
-            if new_grid[new_y, new_x, 0] == EMPTY:
-                new_grid[new_y, new_x] = [FISH, new_dir]
-            else:
-                # Buscar dirección alternativa
-                moved = False
-                for offset in [1, -1, 2, -2, 3, -3, 4, -4]:
-                    alt_dir = (new_dir + offset) % 8
-                    dx, dy = DIRECTIONS[alt_dir]
-                    alt_x, alt_y = (x + dx) % self.width, (y + dy) % self.height
+                # Intentar mover a la dirección deseada
+                if new_grid[new_y, new_x, 0] == EMPTY:
+                    new_grid[new_y, new_x] = [FISH, new_dir]
+                else:
+                    # Buscar dirección alternativa
+                    moved = False
+                    for offset in [1, -1, 2, -2, 3, -3, 4, -4]:
+                        alt_dir = (new_dir + offset) % 8
+                        dx, dy = DIRECTIONS[alt_dir]
+                        alt_x, alt_y = (x + dx) % self.width, (y + dy) % self.height
                     
-                    if new_grid[alt_y, alt_x, 0] == EMPTY:
-                        new_grid[alt_y, alt_x] = [FISH, alt_dir]
-                        moved = True
-                        break
+                        if new_grid[alt_y, alt_x, 0] == EMPTY:
+                            new_grid[alt_y, alt_x] = [FISH, alt_dir]
+                            moved = True
+                            break
                 
-                # Si no se pudo mover, permanece en su posición con nueva dirección
-                if not moved:
-                    if new_grid[y, x, 0] == EMPTY:
-                        new_grid[y, x] = [FISH, new_dir]
+                    # Si no se pudo mover, permanece en su posición con nueva dirección
+                    if not moved:
+                        if new_grid[y, x, 0] == EMPTY:
+                            new_grid[y, x] = [FISH, new_dir]
+        profiler.fase("moves")
         
-        self.grid = new_grid
+        self._back, self.grid = self.grid, new_grid
+        if self.recorder is not None:
+            self.recorder.agregar(self.grid)
+        profiler.fase("record")
+        profiler.terminar(fish=len(fish_xs))
+
+# Métricas de resumen. Aceptan mundos apilados en ejes iniciales de la grilla
+HEADING_X = DIRECTION_DX / np.hypot(DIRECTION_DX, DIRECTION_DY)
+HEADING_Y = DIRECTION_DY / np.hypot(DIRECTION_DX, DIRECTION_DY)
+
+def polarization(grid):
+    """Módulo del rumbo medio de los peces (1 si todos nadan hacia el mismo lado)."""
+    fish = grid[..., 0] == FISH
+    directions = grid[..., 1]
+    count = fish.sum(axis=(-2, -1))
+    heading_x = np.where(fish, HEADING_X[directions], 0.0).sum(axis=(-2, -1))
+    heading_y = np.where(fish, HEADING_Y[directions], 0.0).sum(axis=(-2, -1))
+    return np.hypot(heading_x, heading_y) / np.maximum(count, 1)
+
+def cluster_count(grid, backend=None):
+    """Número de grupos de peces conectados (vecindad de 8, con vuelta toroidal).
+
+    backend "numba" cuenta con unión-búsqueda en una pasada
+    (nucleos.contar_grupos_2d); "python" propaga etiquetas con np.roll, con
+    un coste que crece con el diámetro de los grupos. None elige numba si
+    está instalado.
+    """
+    if nucleos.elegir(backend) == "python":
+        return _cluster_count_labels(grid)
+    types = grid[..., 0]
+    height, width = types.shape[-2:]
+    parents = np.empty(height * width, dtype=np.int32 if height * width < 2**31 else np.int64)
+    counts = nucleos.contar_grupos_2d(types.reshape(-1, height, width), parents)
+    return counts.reshape(types.shape[:-2])[()]
+
+def _cluster_count_labels(grid):
+    # Cada pez se queda con la etiqueta mínima de sus vecinos hasta que no
+    # cambie nada; cuenta los peces que conservan su propia etiqueta
+    fish = grid[..., 0] == FISH
+    cell_ids = np.arange(fish.size).reshape(fish.shape)
+    labels = np.where(fish, cell_ids, fish.size)
+    while True:
+        new_labels = labels.copy()
+        for dx, dy in _neighbor_offsets(1):
+            np.minimum(new_labels, np.roll(new_labels, (dy, dx), axis=(-2, -1)),
+                       out=new_labels, where=fish)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return (fish & (labels == cell_ids)).sum(axis=(-2, -1))
+
+# Pares pez-depredador por bloque en predator_distance: acota los temporales
+# (unos 8 MB por array) con un millón de peces
+PREDATOR_DISTANCE_BLOCK = 1 << 20
+
+def predator_distance(grid):
+    """Distancia media de cada pez al depredador más cercano (NaN si faltan unos u otros).
+
+    Los peces se recorren en bloques de PREDATOR_DISTANCE_BLOCK pares con los
+    depredadores, así que la memoria no crece con peces × depredadores.
+    """
+    types = grid[..., 0]
+    height, width = types.shape[-2:]
+    worlds = types.reshape(-1, height, width)
+    distances = np.full(len(worlds), np.nan)
+    for i, world in enumerate(worlds):
+        fish_y, fish_x = np.nonzero(world == FISH)
+        predator_y, predator_x = np.nonzero(world == PREDATOR)
+        if len(fish_x) and len(predator_x):
+            nearest = np.empty(len(fish_x))
+            block = max(1, PREDATOR_DISTANCE_BLOCK // len(predator_x))
+            for start in range(0, len(fish_x), block):
+                end = start + block
+                dx = np.abs(fish_x[start:end, None] - predator_x)
+                dy = np.abs(fish_y[start:end, None] - predator_y)
+                dx = np.minimum(dx, width - dx)
+                dy = np.minimum(dy, height - dy)
+                nearest[start:end] = np.sqrt(dx**2 + dy**2).min(axis=1)
+            distances[i] = nearest.mean()
+    return distances.reshape(types.shape[:-2])
+
+class SimulationWorker(threading.Thread):
+    """Avanza el autómata en un hilo aparte y publica el último cuadro terminado.
+
+    El hilo escribe cada paso en un búfer trasero y lo intercambia con el
+    delantero bajo un lock; quien dibuja copia el delantero con latest_frame()
+    y nunca toca automaton.grid mientras el hilo está vivo.
+    steps_per_second limita el ritmo; con None avanza lo más rápido posible.
+    """
+
+    def __init__(self, automaton, steps_per_second=None):
+        super().__init__(daemon=True)
+        self.automaton = automaton
+        self.steps_per_second = steps_per_second
+        self.paused = threading.Event()
+        self.stopped = threading.Event()
+        self.error = None
+        self._lock = threading.Lock()
+        self._front = automaton.grid.copy()
+        self._back = automaton.grid.copy()
+        self._frame = 0  # pasos completados que hay en el búfer delantero
+        self._rate_count = 0
+        self._rate_start = time.perf_counter()
+
+    def run(self):
+        period = 1.0 / self.steps_per_second if self.steps_per_second else 0.0
+        next_step = time.perf_counter()
+        try:
+            while not self.stopped.is_set():
+                if self.paused.is_set():
+                    self.stopped.wait(0.01)
+                    next_step = time.perf_counter()
+                    continue
+                self.automaton.update()
+                if self._back.shape != self.automaton.grid.shape:
+                    self._back = np.empty_like(self.automaton.grid)
+                np.copyto(self._back, self.automaton.grid)
+                with self._lock:
+                    self._front, self._back = self._back, self._front
+                    self._frame += 1
+                    self._rate_count += 1
+                if period:
+                    next_step = max(next_step + period, time.perf_counter() - period)
+                    self.stopped.wait(max(0.0, next_step - time.perf_counter()))
+        except Exception as error:  # se vuelve a lanzar desde stop()
+            self.error = error
+
+    def latest_frame(self, out=None):
+        """Copia del último cuadro completo y su número de paso"""
+        with self._lock:
+            if out is None or out.shape != self._front.shape:
+                out = self._front.copy()
+            else:
+                np.copyto(out, self._front)
+            return out, self._frame
+
+    def steps_per_second_measured(self):
+        """Pasos por segundo desde la última consulta"""
+        with self._lock:
+            now = time.perf_counter()
+            rate = self._rate_count / max(now - self._rate_start, 1e-9)
+            self._rate_count = 0
+            self._rate_start = now
+        return rate
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        if self.error is not None:
+            raise self.error
+
+
+def _import_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as module
+        pygame = module
+    return pygame
+
 
 # Configuración de Pygame para visualización
 class SimulationVisualizer:
-    def __init__(self, automaton, cell_size=20):
+    def __init__(self, automaton, cell_size=20, render_mode="full", window_size=None):
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"Modo de dibujo desconocido: {render_mode!r} (opciones: {', '.join(RENDER_MODES)})")
         self.automaton = automaton
         self.cell_size = cell_size
-        self.width = automaton.width * cell_size
-        self.height = automaton.height * cell_size
+        self.render_mode = render_mode
+        # Grilla del último cuadro dibujado, para el modo "dirty"
+        self.previous_grid = None
+        # Superficie de una celda por píxel para el modo "array"
+        self.cells_surface = None
+        # Perfil (perfilado.Perfil) que mide cada fase de un cuadro; NULO no mide nada
+        self.profiler = perfilado.NULO
+        # Pasos/s del autómata y cuadros/s dibujados en el último segundo del
+        # modo threaded (0 hasta el primer informe)
+        self.sim_rate = 0.0
+        self.render_rate = 0.0
+        _import_pygame()
+        max_width, max_height = window_size or MAX_WINDOW_SIZE
+        self.width = min(automaton.width * cell_size, max_width)
+        self.height = min(automaton.height * cell_size, max_height)
+        # Cámara: celda de la esquina superior izquierda de la ventana y celdas
+        # por lado de cada mosaico de densidad (1 si se ven las celdas)
+        self.camera_x = 0
+        self.camera_y = 0
+        self.tile = 1
+        # Posición del ratón y de la cámara al empezar a arrastrar
+        self.drag_start = None
+        # Teclas que mueven la cámara un cuarto de la vista
+        self.pan_keys = {pygame.K_a: (-1, 0), pygame.K_d: (1, 0), pygame.K_w: (0, -1), pygame.K_s: (0, 1)}
         
         pygame.init()
         self.screen = pygame.display.set_mode((self.width, self.height))
-        pygame.display.set_caption("Simulación de Cardumen con Depredadores y Obstáculos")
+        self.caption = "Simulación de Cardumen con Depredadores y Obstáculos"
+        pygame.display.set_caption(self.caption)
         self.clock = pygame.time.Clock()
         
         # Colores
@@ -258,10 +687,29 @@ class SimulationVisualizer:
 
         }
 
-        # Cargar imagen del pez (gif) y rellenar fondo transparente y semitransparente con color del océano
+        # Paletas del modo "array": color de cada tipo ya en el formato de
+        # píxel de la pantalla, indexadas por el valor del tipo. La de fondo
+        # pinta peces y depredadores como océano para poner encima los sprites
+        self.palette = np.array([self.screen.map_rgb(self.colors[cell_type])
+                                 for cell_type in range(len(self.colors))], dtype=np.uint32)
+        self.background_palette = self.palette.copy()
+        self.background_palette[[FISH, PREDATOR]] = self.palette[EMPTY]
+        # Mosaicos de densidad: del océano al color de los peces según la
+        # fracción de celdas con pez
+        levels = np.linspace(0.0, 1.0, 256)[:, None]
+        ramp = np.rint((1 - levels) * self.colors[EMPTY] + levels * self.colors[FISH]).astype(int)
+        self.density_palette = np.array([self.screen.map_rgb(tuple(color)) for color in ramp.tolist()],
+                                        dtype=np.uint32)
+
+        self.raw_fish_img = pygame.image.load(os.path.join(ASSETS_DIR, "pez_animado_nemo.gif")).convert_alpha()
+        self.raw_predator_img = pygame.image.load(os.path.join(ASSETS_DIR, "tiburon.gif")).convert_alpha()
+        self._load_sprites()
+
+    def _load_sprites(self):
+        """Escala los sprites a cell_size; se repite cuando el zoom lo cambia"""
+        # Imagen del pez (gif) con el fondo transparente y semitransparente rellenado con color del océano
         fish_size = int(self.cell_size * 0.98)
-        raw_fish_img = pygame.image.load("pez_animado_nemo.gif").convert_alpha()
-        fish_img = pygame.transform.smoothscale(raw_fish_img, (fish_size, fish_size))
+        fish_img = pygame.transform.smoothscale(self.raw_fish_img, (fish_size, fish_size))
         ocean_color = self.colors[EMPTY]
         # Crear superficie opaca del color del océano
         fish_bg = pygame.Surface((fish_size, fish_size)).convert()
@@ -271,69 +719,468 @@ class SimulationVisualizer:
         self.fish_img = fish_bg
         self.fish_img_offset = (self.cell_size - fish_size) // 2
 
-        # Cargar imagen del depredador (tiburón) y rellenar fondo transparente y semitransparente con color del océano
+        # Imagen del depredador (tiburón) con el fondo transparente y semitransparente rellenado con color del océano
         predator_size = int(self.cell_size * 0.98)
-        raw_predator_img = pygame.image.load("tiburon.gif").convert_alpha()
-        predator_img = pygame.transform.smoothscale(raw_predator_img, (predator_size, predator_size))
+        predator_img = pygame.transform.smoothscale(self.raw_predator_img, (predator_size, predator_size))
         predator_bg = pygame.Surface((predator_size, predator_size)).convert()
         predator_bg.fill(ocean_color)
         predator_bg.blit(predator_img, (0, 0), special_flags=pygame.BLEND_PREMULTIPLIED)
         self.predator_img = predator_bg
         self.predator_img_offset = (self.cell_size - predator_size) // 2
 
-    def draw_grid(self):
-        for y in range(self.automaton.height):
-            for x in range(self.automaton.width):
-                cell_type = self.automaton.grid[y, x, 0]
-                color = self.colors[cell_type]
-                rect = pygame.Rect(
-                    x * self.cell_size,
-                    y * self.cell_size,
-                    self.cell_size,
-                    self.cell_size
-                )
-                if cell_type == EMPTY:
-                    pygame.draw.rect(self.screen, color, rect)
-                elif cell_type == FISH:
-                    direction = self.automaton.grid[y, x, 1]
-                    angle = direction * 45  # 8 direcciones
-                    rotated_img = pygame.transform.rotate(self.fish_img, -angle)
-                    img_rect = rotated_img.get_rect()
-                    img_rect.topleft = (rect.x + self.fish_img_offset, rect.y + self.fish_img_offset)
-                    self.screen.blit(rotated_img, img_rect)
-                elif cell_type == PREDATOR:
-                    # Mostrar el tiburón
-                    rotated_img = pygame.transform.rotate(self.predator_img, 0)
-                    img_rect = rotated_img.get_rect()
-                    img_rect.topleft = (rect.x + self.predator_img_offset, rect.y + self.predator_img_offset)
-                    self.screen.blit(rotated_img, img_rect)
+        # Pre-renderizar las 8 orientaciones del pez. Con el color del océano
+        # como colorkey, las esquinas que añade la rotación son transparentes
+        self.fish_img.set_colorkey(ocean_color)
+        self.fish_sprites = [
+            pygame.transform.rotate(self.fish_img, -direction * 45)  # 8 direcciones
+            for direction in range(len(DIRECTIONS))
+        ]
+
+        # Los sprites rotados en diagonal son más grandes que la celda y, como se
+        # colocan desde la esquina superior izquierda, invaden las celdas de la
+        # derecha y de abajo. reach es cuántas celdas como máximo
+        overflow = max(
+            max(sprite.get_width(), sprite.get_height()) + self.fish_img_offset
+            for sprite in self.fish_sprites
+        )
+        overflow = max(overflow, predator_size + self.predator_img_offset)
+        self.reach = max(0, -(-overflow // self.cell_size) - 1)
+
+    def draw_grid(self, grid=None):
+        if grid is None:
+            grid = self.automaton.grid
+        cell_size = self.cell_size
+        profiler = self.profiler
+        profiler.iniciar("draw_grid")
+
+        # El océano de una vez y encima los obstáculos
+        self.screen.fill(self.colors[EMPTY])
+        obstacles = np.nonzero(grid[:, :, 0] == OBSTACLE)
+        for y, x in zip(*obstacles):
+            rect = (x * cell_size, y * cell_size, cell_size, cell_size)
+            pygame.draw.rect(self.screen, self.colors[OBSTACLE], rect)
+        profiler.fase("background")
+
+        # Peces y depredadores en una sola llamada a blits, en el mismo orden
+        # por filas que antes
+        sprites = self._sprite_blits(grid)
+        profiler.fase("sprites")
+        self.screen.blits(sprites, doreturn=False)
+        profiler.fase("blit")
+        profiler.terminar(sprites=len(sprites), obstacles=len(obstacles[0]))
+
+    def draw_array(self, grid=None):
+        """Dibuja la grilla pasando el plano de tipos por la paleta.
+
+        El resultado, un píxel por celda, se copia a cells_surface con
+        surfarray y se escala a cell_size en una sola transformación, así que
+        el coste por celda es de numpy y no de una llamada de pygame. Los
+        sprites solo se ponen encima si cell_size llega a SPRITE_MIN_CELL_SIZE.
+        """
+        if grid is None:
+            grid = self.automaton.grid
+        cell_size = self.cell_size
+        profiler = self.profiler
+        profiler.iniciar("draw_array")
+
+        types = grid[:, :, 0]
+        height, width = types.shape
+        cells = self._cells_surface(width, height)
+        show_sprites = cell_size >= SPRITE_MIN_CELL_SIZE
+        palette = self.background_palette if show_sprites else self.palette
+        # surfarray indexa por (x, y): se pasa el plano traspuesto
+        pygame.surfarray.blit_array(cells, palette.take(types.T))
+        profiler.fase("palette")
+        size = (width * cell_size, height * cell_size)
+        if cell_size > 1 and size == self.screen.get_size():
+            pygame.transform.scale(cells, size, self.screen)
+        else:
+            # La vista no coincide con la ventana: se sale por el borde
+            # derecho o inferior o, con un océano pequeño, no la llena
+            if size[0] < self.width or size[1] < self.height:
+                self.screen.fill(self.colors[EMPTY])
+            self.screen.blit(cells if cell_size == 1 else pygame.transform.scale(cells, size), (0, 0))
+        profiler.fase("scale")
+
+        sprites = self._sprite_blits(grid) if show_sprites else []
+        profiler.fase("sprites")
+        self.screen.blits(sprites, doreturn=False)
+        profiler.fase("blit")
+        profiler.terminar(sprites=len(sprites))
+
+    def draw_density(self, grid=None):
+        """Dibuja la grilla en mosaicos de tile×tile celdas, un píxel cada uno.
+
+        El color va del océano al de los peces según la fracción de celdas con
+        pez; un mosaico con algún depredador o con mayoría de obstáculos toma
+        el color de estos. Las celdas que no completan un mosaico en el borde
+        no se dibujan.
+        """
+        if grid is None:
+            grid = self.automaton.grid
+        tile = self.tile
+        profiler = self.profiler
+        profiler.iniciar("draw_density")
+
+        rows, cols = grid.shape[0] // tile, grid.shape[1] // tile
+        types = grid[:rows * tile, :cols * tile, 0]
+        # Primero se suman las filas de cada mosaico y luego las columnas
+        counts = np.zeros((rows, cols * tile), dtype=np.uint32)
+        for row in range(tile):
+            counts += TILE_COUNT_CODES.take(types[row::tile])
+        tiles = np.zeros((rows, cols), dtype=np.uint32)
+        for col in range(tile):
+            tiles += counts[:, col::tile]
+        fish = tiles & 0x3FF
+        predators = (tiles >> 10) & 0x3FF
+        obstacles = tiles >> 20
+        colors = self.density_palette.take(fish * (len(self.density_palette) - 1) // (tile * tile))
+        colors[obstacles * 2 > tile * tile] = self.palette[OBSTACLE]
+        colors[predators > 0] = self.palette[PREDATOR]
+        profiler.fase("counts")
+
+        cells = self._cells_surface(cols, rows)
+        pygame.surfarray.blit_array(cells, colors.T)
+        if cols < self.width or rows < self.height:
+            self.screen.fill(self.colors[EMPTY])
+        self.screen.blit(cells, (0, 0))
+        profiler.fase("blit")
+        profiler.terminar(tiles=rows * cols)
+
+    def _cells_surface(self, width, height):
+        """cells_surface con el tamaño pedido, creada de nuevo solo si cambia"""
+        if self.cells_surface is None or self.cells_surface.get_size() != (width, height):
+            self.cells_surface = pygame.Surface((width, height)).convert(self.screen)
+        return self.cells_surface
+
+    def _sprite_blits(self, grid):
+        """(sprite, posición) de cada pez y depredador, por filas, para screen.blits"""
+        cell_size = self.cell_size
+        sprites = []
+        ys, xs = np.nonzero((grid[:, :, 0] == FISH) | (grid[:, :, 0] == PREDATOR))
+        for y, x in zip(ys.tolist(), xs.tolist()):
+            sprite, offset = self._sprite(grid, y, x)
+            sprites.append((sprite, (x * cell_size + offset, y * cell_size + offset)))
+        return sprites
+
+    def _sprite(self, grid, y, x):
+        """Sprite y desplazamiento dentro de la celda, o (None, 0) si no hay pez ni depredador"""
+        cell_type = grid[y, x, 0]
+        if cell_type == FISH:
+            return self.fish_sprites[grid[y, x, 1]], self.fish_img_offset
+        if cell_type == PREDATOR:
+            return self.predator_img, self.predator_img_offset
+        return None, 0
+
+    def draw_dirty(self, grid=None):
+        """Redibuja solo las celdas que cambiaron desde el último cuadro.
+
+        Devuelve la lista de rectángulos modificados para pygame.display.update.
+        El primer cuadro (o tras reset_dirty) se dibuja entero.
+        """
+        if grid is None:
+            grid = self.automaton.grid
+        if self.previous_grid is None or self.previous_grid.shape != grid.shape:
+            self.draw_grid(grid)
+            self.previous_grid = grid.copy()
+            return [self.screen.get_rect()]
+
+        profiler = self.profiler
+        profiler.iniciar("draw_dirty")
+        changed = (grid != self.previous_grid).any(axis=-1)
+        self.previous_grid = grid.copy()
+        if not changed.any():
+            profiler.fase("diff")
+            profiler.terminar(rects=0, sprites=0)
+            return []
+
+        # Una celda también se ve afectada si cambió alguna celda de arriba o de
+        # la izquierda cuyo sprite la invade (sin envolver: la pantalla no es toroidal)
+        reach = self.reach
+        dirty = changed.copy()
+        for dy in range(reach + 1):
+            for dx in range(reach + 1):
+                if dy or dx:
+                    dirty[dy:, dx:] |= changed[:changed.shape[0] - dy, :changed.shape[1] - dx]
+
+        # Celdas sucias contiguas de una fila se agrupan en un solo rectángulo
+        padded = np.zeros((dirty.shape[0], dirty.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = dirty
+        edges = np.diff(padded, axis=1)
+        starts_y, starts_x = np.nonzero(edges == 1)
+        ends_x = np.nonzero(edges == -1)[1]
+        profiler.fase("diff")
+
+        cell_size = self.cell_size
+        rects = []
+        for y, x0, x1 in zip(starts_y.tolist(), starts_x.tolist(), ends_x.tolist()):
+            rect = pygame.Rect(x0 * cell_size, y * cell_size, (x1 - x0) * cell_size, cell_size)
+            self.screen.fill(self.colors[EMPTY], rect)
+            rects.append(rect)
+
+        # Los obstáculos no desbordan su celda: basta con pintarlos antes de los sprites
+        obstacles = np.nonzero(dirty & (grid[:, :, 0] == OBSTACLE))
+        for y, x in zip(*(axis.tolist() for axis in obstacles)):
+            rect = (x * cell_size, y * cell_size, cell_size, cell_size)
+            pygame.draw.rect(self.screen, self.colors[OBSTACLE], rect)
+        profiler.fase("background")
+
+        # Sprites que tocan alguna celda sucia, en el mismo orden por filas que
+        # draw_grid y recortados a cada celda sucia para no pisar las demás
+        touches = np.zeros_like(dirty)
+        for dy in range(reach + 1):
+            for dx in range(reach + 1):
+                touches[:touches.shape[0] - dy, :touches.shape[1] - dx] |= dirty[dy:, dx:]
+        entities = (grid[:, :, 0] == FISH) | (grid[:, :, 0] == PREDATOR)
+        dirty_cells = dirty.tolist()
+        height, width = dirty.shape
+        sprites = []
+        for y, x in zip(*(axis.tolist() for axis in np.nonzero(entities & touches))):
+            sprite, offset = self._sprite(grid, y, x)
+            position = (x * cell_size + offset, y * cell_size + offset)
+            sprite_rect = sprite.get_rect(topleft=position)
+            for cy in range(y, min(y + reach + 1, height)):
+                for cx in range(x, min(x + reach + 1, width)):
+                    if not dirty_cells[cy][cx]:
+                        continue
+                    area = sprite_rect.clip((cx * cell_size, cy * cell_size, cell_size, cell_size))
+                    if area.width and area.height:
+                        sprites.append((sprite, area.topleft, area.move(-position[0], -position[1])))
+        profiler.fase("sprites")
+        self.screen.blits(sprites, doreturn=False)
+        profiler.fase("blit")
+        profiler.terminar(rects=len(rects), sprites=len(sprites))
+        return rects
+
+    def reset_dirty(self):
+        """Fuerza a que el siguiente draw_dirty dibuje la pantalla entera"""
+        self.previous_grid = None
+
+    def visible_size(self):
+        """Celdas (ancho, alto) que caben en la ventana con el zoom actual"""
+        if self.tile > 1:
+            return self.width * self.tile, self.height * self.tile
+        return -(-self.width // self.cell_size), -(-self.height // self.cell_size)
+
+    def visible(self, grid):
+        """Parte de grid que enfoca la cámara"""
+        width, height = self.visible_size()
+        return grid[self.camera_y:self.camera_y + height, self.camera_x:self.camera_x + width]
+
+    def move_camera(self, x, y):
+        """Pone en la esquina superior izquierda la celda (x, y), sin salirse del océano"""
+        width, height = self.visible_size()
+        x = int(min(max(x, 0), max(self.automaton.width - width, 0)))
+        y = int(min(max(y, 0), max(self.automaton.height - height, 0)))
+        if (x, y) != (self.camera_x, self.camera_y):
+            self.camera_x, self.camera_y = x, y
+            self.reset_dirty()
+
+    def zoom(self, steps, anchor=(0, 0)):
+        """Acerca (steps > 0) o aleja la cámara sin mover la celda bajo el píxel anchor.
+
+        Cada paso dobla o divide a la mitad cell_size; por debajo de un píxel
+        por celda se pasa a mosaicos de densidad de tile×tile celdas.
+        """
+        cell_size, tile = self.cell_size, self.tile
+        for _ in range(abs(steps)):
+            if steps > 0:
+                if tile > 1:
+                    tile //= 2
                 else:
-                    pygame.draw.rect(self.screen, color, rect)
-    
-    def run(self, fps=10):
+                    cell_size = min(cell_size * 2, MAX_CELL_SIZE)
+            elif cell_size > 1:
+                cell_size //= 2
+            else:
+                tile = min(tile * 2, MAX_TILE)
+        if (cell_size, tile) == (self.cell_size, self.tile):
+            return
+        # Celda bajo el ancla antes del zoom
+        anchor_x = self.camera_x + anchor[0] * self.tile / self.cell_size
+        anchor_y = self.camera_y + anchor[1] * self.tile / self.cell_size
+        resized = cell_size != self.cell_size
+        self.cell_size, self.tile = cell_size, tile
+        if resized:
+            self._load_sprites()
+        self.reset_dirty()
+        self.move_camera(round(anchor_x - anchor[0] * tile / cell_size),
+                         round(anchor_y - anchor[1] * tile / cell_size))
+
+    def handle_camera_event(self, event):
+        """Zoom con la rueda hacia el cursor y desplazamiento arrastrando con el
+        botón izquierdo o con W/A/S/D. Devuelve si el evento era de la cámara"""
+        if event.type == pygame.MOUSEWHEEL:
+            self.zoom(event.y, pygame.mouse.get_pos())
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.drag_start = (event.pos, self.camera_x, self.camera_y)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.drag_start = None
+        elif event.type == pygame.MOUSEMOTION and self.drag_start is not None:
+            (start_x, start_y), camera_x, camera_y = self.drag_start
+            cells_per_pixel = self.tile / self.cell_size
+            self.move_camera(round(camera_x - (event.pos[0] - start_x) * cells_per_pixel),
+                             round(camera_y - (event.pos[1] - start_y) * cells_per_pixel))
+        elif event.type == pygame.KEYDOWN and event.key in self.pan_keys:
+            dx, dy = self.pan_keys[event.key]
+            width, height = self.visible_size()
+            self.move_camera(self.camera_x + dx * max(width // 4, 1), self.camera_y + dy * max(height // 4, 1))
+        else:
+            return False
+        return True
+
+    def present(self, grid=None):
+        """Dibuja la parte de grid (por defecto la del autómata) que enfoca la
+        cámara según render_mode, o en mosaicos de densidad si está alejada
+        por debajo de un píxel por celda, y lo muestra"""
+        profiler = self.profiler
+        grid = self.visible(self.automaton.grid if grid is None else grid)
+        if self.render_mode == "dirty" and self.tile == 1:
+            rects = self.draw_dirty(grid)
+            profiler.fase("draw")
+            pygame.display.update(rects)
+        else:
+            if self.tile > 1:
+                self.draw_density(grid)
+            elif self.render_mode == "array":
+                self.draw_array(grid)
+            else:
+                self.draw_grid(grid)
+            profiler.fase("draw")
+            pygame.display.flip()
+        profiler.fase("flip")
+
+    def handle_events(self, paused):
+        """Procesa la entrada. Devuelve (seguir, pausado)"""
+        running = True
+        for event in pygame.event.get():
+            if self.handle_camera_event(event):
+                continue
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_q:
+                    running = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                # La ventana se tapó o cambió: hay que volver a pintarla entera
+                self.reset_dirty()
+        return running, paused
+
+    def run(self, fps=10, threaded=False, steps_per_second=None):
+        """Bucle principal. Con threaded el autómata avanza en un SimulationWorker
+        y aquí solo se dibuja el último cuadro terminado, sin esperar al paso
+        en curso; el título muestra pasos/s y cuadros/s por separado."""
+        if threaded:
+            self._run_threaded(fps, steps_per_second)
+            return
+
         running = True
         paused = False
         
+        while running:
+            profiler = self.profiler
+            profiler.iniciar("frame")
+            running, paused = self.handle_events(paused)
+            profiler.fase("events")
+            
+            if not paused:
+                self.automaton.update()
+            profiler.fase("update")
+            
+            self.present()
+            self.clock.tick(fps)
+            profiler.fase("wait")
+            profiler.terminar()
+        
+        pygame.quit()
+
+    def replay(self, reader, fps=10):
+        """Reproduce una grabación (trayectorias.Lector) sin simular.
+
+        Espacio reproduce o pausa, las flechas izquierda/derecha retroceden o
+        avanzan un paso, RePág/AvPág cien e Inicio/Fin saltan a los extremos.
+        La cámara se maneja como en run (ver handle_camera_event).
+        """
+        jumps = {pygame.K_RIGHT: 1, pygame.K_LEFT: -1, pygame.K_PAGEDOWN: 100, pygame.K_PAGEUP: -100}
+        step = 0
+        shown = -1
+        playing = True
+        running = True
         while running:
             for event in pygame.event.get():
+                if self.handle_camera_event(event):
+                    continue
                 if event.type == pygame.QUIT:
                     running = False
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_SPACE:
-                        paused = not paused
+                        playing = not playing
                     elif event.key == pygame.K_q:
                         running = False
-            
-            if not paused:
-                self.automaton.update()
-            
-            self.screen.fill((0, 0, 0))
-            self.draw_grid()
-            pygame.display.flip()
+                    elif event.key in jumps:
+                        step += jumps[event.key]
+                    elif event.key == pygame.K_HOME:
+                        step = 0
+                    elif event.key == pygame.K_END:
+                        step = len(reader) - 1
+                elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.reset_dirty()
+            step = min(max(step, 0), len(reader) - 1)
+
+            if step != shown or self.previous_grid is None:
+                self.present(reader[step])
+                pygame.display.set_caption(f"{self.caption} | paso {step}/{len(reader) - 1}")
+                shown = step
+            if playing and step < len(reader) - 1:
+                step += 1
             self.clock.tick(fps)
-        
+
         pygame.quit()
 
+    def _run_threaded(self, fps, steps_per_second):
+        worker = SimulationWorker(self.automaton, steps_per_second)
+        worker.start()
+        frame = None
+        shown = -1
+        frames_drawn = 0
+        report_start = time.perf_counter()
+        running = True
+        paused = False
+        try:
+            while running and worker.is_alive():
+                running, paused = self.handle_events(paused)
+                if paused:
+                    worker.paused.set()
+                else:
+                    worker.paused.clear()
+
+                profiler = self.profiler
+                profiler.iniciar("frame")
+                frame, step = worker.latest_frame(frame)
+                profiler.fase("latest_frame")
+                if step != shown or self.previous_grid is None:
+                    self.present(frame)
+                    shown = step
+                    frames_drawn += 1
+                self.clock.tick(fps)
+                profiler.fase("wait")
+                profiler.terminar()
+
+                elapsed = time.perf_counter() - report_start
+                if elapsed >= 1.0:
+                    self.sim_rate = worker.steps_per_second_measured()
+                    self.render_rate = frames_drawn / elapsed
+                    pygame.display.set_caption(
+                        f"{self.caption} | paso {step} | sim {self.sim_rate:.1f} pasos/s"
+                        f" | render {self.render_rate:.1f} fps"
+                    )
+                    frames_drawn = 0
+                    report_start = time.perf_counter()
+        finally:
+            worker.stop()
+            pygame.quit()
+
 # Parámetros de la simulación
 GRID_WIDTH = 60
 GRID_HEIGHT = 40
@@ -341,15 +1188,111 @@ NUM_FISH = 150
 NUM_PREDATORS = 7
 NUM_OBSTACLES = 21
 
-if __name__ == "__main__":
+METRIC_FIELDS = ("step", "fish", "polarization", "clusters", "predator_distance", "steps_per_second")
+
+
+def run_headless(automaton, steps, every=10):
+    """Avanza el autómata sin ventana y cada `every` pasos (y en el último)
+    devuelve una fila con las métricas de resumen."""
+    start_time = time.perf_counter()
+    last_time, last_step = start_time, 0
+    for step in range(1, steps + 1):
+        automaton.update()
+        if step % every and step != steps:
+            continue
+        now = time.perf_counter()
+        grid = automaton.grid
+        yield {
+            "step": step,
+            "fish": int(np.count_nonzero(grid[..., 0] == FISH)),
+            "polarization": float(polarization(grid)),
+            "clusters": int(cluster_count(grid)),
+            "predator_distance": float(predator_distance(grid)),
+            "steps_per_second": (step - last_step) / max(now - last_time, 1e-9),
+        }
+        last_time, last_step = now, step
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cardumen 2D con depredadores y obstáculos")
+    parser.add_argument("--width", type=int, default=GRID_WIDTH)
+    parser.add_argument("--height", type=int, default=GRID_HEIGHT)
+    parser.add_argument("--fish", type=int, default=NUM_FISH)
+    parser.add_argument("--predators", type=int, default=NUM_PREDATORS)
+    parser.add_argument("--obstacles", type=int, default=NUM_OBSTACLES)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--engine", choices=ENGINES, default="scalar")
+    parser.add_argument("--move-backend", choices=("python", "numba"), default=None,
+                        help="resolución de movimientos (por defecto numba si está instalado)")
+    parser.add_argument("--headless", action="store_true",
+                        help="sin ventana ni pygame: avanza --steps pasos y escribe métricas")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--every", type=int, default=10, help="pasos entre filas de métricas")
+    parser.add_argument("--output", default="-", help="CSV de métricas ('-' para stdout)")
+    parser.add_argument("--cell-size", type=int, default=23)
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--render-mode", choices=RENDER_MODES, default="full")
+    parser.add_argument("--threaded", action="store_true")
+    parser.add_argument("--record", metavar="ARCHIVO", help="graba la trayectoria en un .npz")
+    parser.add_argument("--replay", metavar="ARCHIVO", help="reproduce una grabación sin simular")
+    parser.add_argument("--profile", metavar="ARCHIVO",
+                        help="mide cada fase del paso y del dibujo; escribe un registro JSON por línea")
+    args = parser.parse_args(argv)
+    if args.every < 1:
+        parser.error("--every debe ser al menos 1")
+
+    if args.replay:
+        reader = trayectorias.Lector(args.replay)
+        height, width = reader.forma[:2]
+        # El autómata solo da las dimensiones a la ventana
+        automaton = CellularAutomaton(width, height, 0, 0, 0, seed=0)
+        visualizer = SimulationVisualizer(automaton, cell_size=args.cell_size, render_mode=args.render_mode)
+        visualizer.replay(reader, fps=args.fps)
+        return
+
     automaton = CellularAutomaton(
-        width=GRID_WIDTH,
-        height=GRID_HEIGHT,
-        num_fish=NUM_FISH,
-        num_predators=NUM_PREDATORS,
-        num_obstacles=NUM_OBSTACLES
+        width=args.width,
+        height=args.height,
+        num_fish=args.fish,
+        num_predators=args.predators,
+        num_obstacles=args.obstacles,
+        engine=args.engine,
+        seed=args.seed,
+        move_backend=args.move_backend
     )
-    
-    # Aumentar el tamaño de celda a 20 para que se vean más grandes
-    visualizer = SimulationVisualizer(automaton, cell_size=23)
-    visualizer.run(fps=10)
\ No newline at end of file
+    if args.record:
+        automaton.recorder = trayectorias.Grabador(args.record)
+        automaton.recorder.agregar(automaton.grid)
+    if args.profile:
+        automaton.profiler = perfilado.Perfil(archivo=args.profile)
+
+    if not args.headless:
+        visualizer = SimulationVisualizer(automaton, cell_size=args.cell_size, render_mode=args.render_mode)
+        visualizer.profiler = automaton.profiler
+        try:
+            visualizer.run(fps=args.fps, threaded=args.threaded)
+        finally:
+            if automaton.recorder is not None:
+                automaton.recorder.cerrar()
+            automaton.profiler.informe()
+            automaton.profiler.cerrar()
+        return
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        writer = csv.DictWriter(out, fieldnames=METRIC_FIELDS)
+        writer.writeheader()
+        for row in run_headless(automaton, args.steps, args.every):
+            writer.writerow(row)
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if automaton.recorder is not None:
+            automaton.recorder.cerrar()
+        automaton.profiler.informe()
+        automaton.profiler.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Barrido de pesos del cardumen 2D sin ventana.
+
+BatchAutomaton avanza B mundos independientes apilados en el primer eje con
+una sola actualización vectorizada. Cada mundo tiene sus propios pesos y su
+semilla, y evoluciona igual que un CellularAutomaton creado con esa semilla.
+
+Ejemplo:
+    python barridoCardumen.py --separation 1 1.5 2 --flee 1 2 3 --steps 200 --output barrido.csv
+"""
+import argparse
+import csv
+import itertools
+import time
+
+import numpy as np
+
+from FinalSimulaiconCardumen import (
+    EMPTY, FISH, PREDATOR, OBSTACLE, DIRECTION_DX, DIRECTION_DY,
+    SEPARATION_WEIGHT, ALIGNMENT_WEIGHT, COHESION_WEIGHT, FLEE_WEIGHT,
+    GRID_WIDTH, GRID_HEIGHT, NUM_FISH, NUM_PREDATORS, NUM_OBSTACLES,
+    CellularAutomaton, direction_field, polarization, cluster_count, predator_distance
+)
+
+# Orden en que se prueban las direcciones al moverse (0 es la deseada)
+MOVE_OFFSETS = (0, 1, -1, 2, -2, 3, -3, 4, -4)
+
+METRICS = ("polarization", "mean_polarization", "clusters", "predator_distance")
+
+
+class BatchAutomaton:
+    def __init__(self, width, height, num_fish, num_predators, num_obstacles, weights, seeds):
+        # weights: una fila (separación, alineación, cohesión, huida) por mundo
+        self.weights = np.asarray(weights, dtype=float).reshape(-1, 4)
+        if len(self.weights) != len(seeds):
+            raise ValueError(f"Hay {len(self.weights)} filas de pesos para {len(seeds)} semillas")
+        self.width = width
+        self.height = height
+        self.seeds = list(seeds)
+
+        # Cada mundo se inicializa como un autómata normal y luego se apilan
+        worlds = [
+            CellularAutomaton(width, height, num_fish, num_predators, num_obstacles,
+                              engine="vectorized", seed=seed)
+            for seed in self.seeds
+        ]
+        self.grid = np.stack([world.grid for world in worlds])  # [mundo, y, x, (tipo, dirección)]
+        self.rngs = [world.rng for world in worlds]
+
+    @property
+    def size(self):
+        return len(self.grid)
+
+    def update(self):
+        types = self.grid[..., 0]
+
+        # Paso 1: Direcciones de todos los mundos a la vez
+        new_directions = direction_field(types, self.grid[..., 1], weights=tuple(self.weights.T))
+
+        # Paso 2: Nueva grilla con los elementos estáticos
+        new_grid = np.zeros_like(self.grid)
+        static = np.isin(types, [PREDATOR, OBSTACLE])
+        new_grid[static] = self.grid[static]
+        new_types = new_grid[..., 0]
+
+        # Paso 3: Orden aleatorio de cada mundo con su generador, igual que
+        # CellularAutomaton.update (shuffle solo depende de la longitud)
+        fish_world, fish_y, fish_x = np.nonzero(types == FISH)
+        counts = np.bincount(fish_world, minlength=self.size)
+        starts = np.cumsum(counts) - counts
+        order = np.zeros((self.size, counts.max(initial=0)), dtype=int)
+        for world, rng in enumerate(self.rngs):
+            permutation = list(range(counts[world]))
+            rng.shuffle(permutation)
+            order[world, :counts[world]] = starts[world] + np.array(permutation, dtype=int)
+
+        # Los mundos avanzan a la par: en la vuelta k se mueve el k-ésimo pez de cada uno
+        for k in range(order.shape[1]):
+            worlds = np.nonzero(counts > k)[0]
+            fish = order[worlds, k]
+            x, y = fish_x[fish], fish_y[fish]
+            new_dir = new_directions[worlds, y, x]
+            pending = np.ones(len(worlds), dtype=bool)
+
+            for offset in MOVE_OFFSETS:
+                alt_dir = (new_dir + offset) % 8
+                alt_x = (x + DIRECTION_DX[alt_dir]) % self.width
+                alt_y = (y + DIRECTION_DY[alt_dir]) % self.height
+                free = pending & (new_types[worlds, alt_y, alt_x] == EMPTY)
+                new_grid[worlds[free], alt_y[free], alt_x[free]] = np.stack(
+                    [np.full(free.sum(), FISH), alt_dir[free]], axis=-1)
+                pending &= ~free
+                if not pending.any():
+                    break
+
+            # Si no se pudo mover, permanece en su posición con nueva dirección
+            stay = pending & (new_types[worlds, y, x] == EMPTY)
+            new_grid[worlds[stay], y[stay], x[stay]] = np.stack(
+                [np.full(stay.sum(), FISH), new_dir[stay]], axis=-1)
+
+        self.grid = new_grid
+
+    def run(self, steps):
+        """Avanza `steps` pasos y devuelve un array por métrica con un valor por mundo."""
+        polarization_sum = np.zeros(self.size)
+        for _ in range(steps):
+            self.update()
+            polarization_sum += polarization(self.grid)
+        return {
+            "polarization": polarization(self.grid),
+            "mean_polarization": polarization_sum / max(steps, 1),
+            "clusters": cluster_count(self.grid),
+            "predator_distance": predator_distance(self.grid),
+        }
+
+
+def sweep(weight_values, steps, width=GRID_WIDTH, height=GRID_HEIGHT, num_fish=NUM_FISH,
+          num_predators=NUM_PREDATORS, num_obstacles=NUM_OBSTACLES,
+          replicates=1, base_seed=0, batch_size=256):
+    """Recorre el producto de weight_values (separación, alineación, cohesión, huida).
+
+    Cada combinación se repite `replicates` veces con semillas consecutivas a
+    partir de base_seed y los mundos se agrupan en lotes de batch_size.
+    Devuelve una fila (dict) por mundo con sus pesos, su semilla y las métricas.
+    """
+    configs = [
+        (weights, base_seed + i * replicates + r)
+        for i, weights in enumerate(itertools.product(*weight_values))
+        for r in range(replicates)
+    ]
+    rows = []
+    for start in range(0, len(configs), batch_size):
+        batch = configs[start:start + batch_size]
+        automaton = BatchAutomaton(
+            width, height, num_fish, num_predators, num_obstacles,
+            weights=[weights for weights, _ in batch],
+            seeds=[seed for _, seed in batch]
+        )
+        metrics = automaton.run(steps)
+        for i, (weights, seed) in enumerate(batch):
+            row = dict(zip(("separation", "alignment", "cohesion", "flee"), weights))
+            row["seed"] = seed
+            row.update({name: metrics[name][i].item() for name in METRICS})
+            rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Barrido de pesos del cardumen 2D sin ventana")
+    parser.add_argument("--separation", type=float, nargs="+", default=[SEPARATION_WEIGHT])
+    parser.add_argument("--alignment", type=float, nargs="+", default=[ALIGNMENT_WEIGHT])
+    parser.add_argument("--cohesion", type=float, nargs="+", default=[COHESION_WEIGHT])
+    parser.add_argument("--flee", type=float, nargs="+", default=[FLEE_WEIGHT])
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--width", type=int, default=GRID_WIDTH)
+    parser.add_argument("--height", type=int, default=GRID_HEIGHT)
+    parser.add_argument("--fish", type=int, default=NUM_FISH)
+    parser.add_argument("--predators", type=int, default=NUM_PREDATORS)
+    parser.add_argument("--obstacles", type=int, default=NUM_OBSTACLES)
+    parser.add_argument("--replicates", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--output", default="barrido.csv")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    rows = sweep(
+        (args.separation, args.alignment, args.cohesion, args.flee), args.steps,
+        width=args.width, height=args.height, num_fish=args.fish,
+        num_predators=args.predators, num_obstacles=args.obstacles,
+        replicates=args.replicates, base_seed=args.seed, batch_size=args.batch_size
+    )
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"{len(rows)} mundos en {time.time() - start_time:.1f}s -> {args.output}")
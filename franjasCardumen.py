@@ -0,0 +1,260 @@
+"""Cardumen 2D repartido en franjas horizontales entre varios procesos.
+
+ParallelAutomaton es un CellularAutomaton cuyas dos grillas (la actual y la
+de reserva) y el campo de direcciones viven en multiprocessing.shared_memory.
+Cada paso se reparte en franjas horizontales y cada proceso hace en la suya:
+- las direcciones, leyendo su franja más HALO filas por arriba y por abajo
+  (con vuelta toroidal); como ninguna regla mira más lejos, cada franja da
+  lo mismo que la grilla completa;
+- la grilla de reserva de sus filas (vacía con los depredadores y
+  obstáculos) y los movimientos de los peces de sus filas interiores, en un
+  orden barajado con una semilla propia de la franja, con el motor de
+  movimiento del autómata (move_backend). Un pez solo escribe a
+  una celda de distancia, así que los de filas interiores no salen de su
+  franja y dos procesos nunca escriben la misma celda.
+
+Los peces de la primera y la última fila de cada franja pueden moverse a la
+franja vecina: el proceso principal los mueve después, en la fase de
+fusión, franja a franja y en el orden barajado de cada una. Las semillas de
+las franjas salen del generador del autómata, así que con la misma semilla y
+las mismas franjas la trayectoria es siempre la misma, sea cual sea el
+número de procesos. No es la de CellularAutomaton, que baraja todos los
+peces juntos; con strip_moves=False los movimientos se hacen como allí, en
+el proceso principal y en el orden global, y la trayectoria es idéntica.
+
+Ejemplo:
+    with ParallelAutomaton(4000, 4000, 1_000_000, 100, 500, seed=1, workers=16) as automaton:
+        for _ in range(100):
+            automaton.update()
+"""
+import argparse
+import os
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import nucleos
+from FinalSimulaiconCardumen import (
+    GRID_DTYPE, SEPARATION_RADIUS, ALIGNMENT_RADIUS, COHESION_RADIUS, FLEE_RADIUS,
+    GRID_WIDTH, GRID_HEIGHT, NUM_FISH, NUM_PREDATORS, NUM_OBSTACLES,
+    EMPTY, FISH, PREDATOR, OBSTACLE, DIRECTION_DX, DIRECTION_DY,
+    CellularAutomaton, direction_field
+)
+
+# Filas de halo de cada franja: el radio de vecindad más grande
+HALO = max(SEPARATION_RADIUS, ALIGNMENT_RADIUS, COHESION_RADIUS, FLEE_RADIUS)
+
+# Vistas de la memoria compartida dentro de cada proceso de trabajo
+_shared = {}
+
+
+def _attach(name):
+    """Abre un bloque compartido creado por otro proceso sin que este lo borre al salir"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Antes de Python 3.13 abrir el bloque también lo registra en el
+        # resource_tracker. Con los tres métodos de arranque (fork, spawn y
+        # forkserver) multiprocessing da a los procesos de trabajo el tracker
+        # del proceso principal, que ya tiene el bloque: el registro repetido
+        # no cambia nada y no hay que deshacerlo, o el bloque se perdería si
+        # el principal muriera sin liberarlo
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(grids_name, directions_name, height, width):
+    grids_block = _attach(grids_name)
+    directions_block = _attach(directions_name)
+    _shared["blocks"] = (grids_block, directions_block)
+    _shared["grids"] = np.ndarray((2, height, width, 2), dtype=GRID_DTYPE, buffer=grids_block.buf)
+    _shared["directions"] = np.ndarray((height, width), dtype=GRID_DTYPE, buffer=directions_block.buf)
+
+
+def _strip_directions(buffer, y0, y1):
+    """Direcciones de las filas [y0, y1) de la grilla `buffer` (0 o 1)"""
+    grid = _shared["grids"][buffer]
+    height = grid.shape[0]
+    rows = np.arange(y0 - HALO, y1 + HALO) % height
+    strip = grid[rows]
+    directions = direction_field(strip[:, :, 0], strip[:, :, 1],
+                                 row_origin=(y0 - HALO) % height, wrap_height=height)
+    _shared["directions"][y0:y1] = directions[HALO:HALO + y1 - y0]
+
+
+def _move_fish(backend):
+    """nucleos.mover_peces_2d compilado, o sin compilar con el motor "python"."""
+    if backend == "numba":
+        return nucleos.mover_peces_2d
+    return nucleos.sin_compilar(nucleos.mover_peces_2d)
+
+
+def _strip_step(buffer, y0, y1, seed, backend):
+    """Paso de las filas [y0, y1) de la grilla `buffer` sobre la otra grilla.
+
+    Calcula las direcciones, prepara la reserva de estas filas y mueve los
+    peces de las filas interiores. Devuelve (xs, ys) de los peces de la
+    primera y la última fila, que pueden salir de la franja, en el orden
+    barajado en que la fusión debe moverlos.
+    """
+    _strip_directions(buffer, y0, y1)
+    grid = _shared["grids"][buffer]
+    new_grid = _shared["grids"][1 - buffer]
+    rows = grid[y0:y1]
+    new_rows = new_grid[y0:y1]
+    new_rows.fill(EMPTY)
+    static = (rows[:, :, 0] == PREDATOR) | (rows[:, :, 0] == OBSTACLE)
+    new_rows[static] = rows[static]
+
+    ys, xs = np.nonzero(rows[:, :, 0] == FISH)
+    ys += y0
+    order = np.random.default_rng(seed).permutation(len(xs))
+    xs, ys = xs[order], ys[order]
+    border = (ys == y0) | (ys == y1 - 1)
+    _move_fish(backend)(new_grid, _shared["directions"], xs[~border], ys[~border],
+                        DIRECTION_DX, DIRECTION_DY)
+    return xs[border], ys[border]
+
+
+def strip_bounds(height, strips):
+    """Filas (y0, y1) de cada franja, repartiendo el resto entre las primeras"""
+    strips = max(1, min(strips, height))
+    edges = np.linspace(0, height, strips + 1).round().astype(int)
+    return [(int(y0), int(y1)) for y0, y1 in zip(edges[:-1], edges[1:])]
+
+
+def _release(executor, blocks):
+    executor.shutdown(wait=True, cancel_futures=True)
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            pass  # quedan vistas vivas; el mapeo se libera cuando desaparezcan
+        block.unlink()
+
+
+class ParallelAutomaton(CellularAutomaton):
+    def __init__(self, width, height, num_fish, num_predators, num_obstacles,
+                 seed=None, move_backend=None, workers=None, strips=None, strip_moves=True):
+        super().__init__(width, height, num_fish, num_predators, num_obstacles,
+                         engine="vectorized", seed=seed, move_backend=move_backend)
+        self.workers = workers or os.cpu_count()
+        # Movimientos por franja con fusión de los bordes, o en el proceso
+        # principal en el orden global como CellularAutomaton. Los dos modos
+        # usan el motor de movimiento elegido (move_backend)
+        self.strip_moves = strip_moves
+        self.strips = strip_bounds(height, strips or self.workers)
+
+        # Las dos grillas que se turnan y el campo de direcciones, en memoria compartida
+        self._grids_block = shared_memory.SharedMemory(create=True, size=2 * self.grid.nbytes)
+        self._directions_block = shared_memory.SharedMemory(create=True, size=height * width)
+        grids = np.ndarray((2, height, width, 2), dtype=GRID_DTYPE, buffer=self._grids_block.buf)
+        self._buffers = (grids[0], grids[1])
+        self._buffers[0][...] = self.grid
+        self.grid, self._back = self._buffers
+        self._directions = np.ndarray((height, width), dtype=GRID_DTYPE, buffer=self._directions_block.buf)
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker,
+            initargs=(self._grids_block.name, self._directions_block.name, height, width)
+        )
+        self._finalizer = weakref.finalize(self, _release, self._executor,
+                                           (self._grids_block, self._directions_block))
+
+    def _current_buffer(self):
+        """Índice (0 o 1) de la grilla compartida que es la actual"""
+        if self.grid is self._buffers[0]:
+            return 0
+        if self.grid is self._buffers[1]:
+            return 1
+        # La grilla se reemplazó desde fuera: se copia a la memoria compartida
+        self._buffers[0][...] = self.grid
+        self.grid, self._back = self._buffers
+        return 0
+
+    def compute_directions(self):
+        if not self._finalizer.alive:
+            return super().compute_directions()
+        buffer = self._current_buffer()
+        futures = [self._executor.submit(_strip_directions, buffer, y0, y1) for y0, y1 in self.strips]
+        wait(futures)
+        for future in futures:
+            future.result()
+        return self._directions
+
+    def update(self):
+        if not self._finalizer.alive or not self.strip_moves:
+            return super().update()
+        profiler = self.profiler
+        profiler.iniciar("update")
+
+        buffer = self._current_buffer()
+        seeds = [self.rng.getrandbits(63) for _ in self.strips]
+        futures = [self._executor.submit(_strip_step, buffer, y0, y1, seed, self.move_backend)
+                   for (y0, y1), seed in zip(self.strips, seeds)]
+        wait(futures)
+        borders = [future.result() for future in futures]
+        profiler.fase("strips")
+
+        # Fusión: los peces de los bordes, franja a franja
+        new_grid = self._buffers[1 - buffer]
+        border_xs = np.concatenate([xs for xs, _ in borders])
+        border_ys = np.concatenate([ys for _, ys in borders])
+        _move_fish(self.move_backend)(new_grid, self._directions, border_xs, border_ys,
+                                      DIRECTION_DX, DIRECTION_DY)
+        profiler.fase("merge")
+
+        self._back, self.grid = self.grid, new_grid
+        if self.recorder is not None:
+            self.recorder.agregar(self.grid)
+        profiler.fase("record")
+        profiler.terminar(border_fish=len(border_xs))
+
+    def close(self):
+        """Termina los procesos y libera la memoria compartida.
+
+        La grilla sigue disponible y update() sigue funcionando en un solo proceso.
+        """
+        if not self._finalizer.alive:
+            return
+        self.grid = self.grid.copy()
+        self._back = np.zeros_like(self.grid)
+        self._directions = np.full(self.grid.shape[:2], -1, dtype=GRID_DTYPE)
+        self._buffers = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cardumen 2D repartido en franjas entre procesos")
+    parser.add_argument("--width", type=int, default=GRID_WIDTH)
+    parser.add_argument("--height", type=int, default=GRID_HEIGHT)
+    parser.add_argument("--fish", type=int, default=NUM_FISH)
+    parser.add_argument("--predators", type=int, default=NUM_PREDATORS)
+    parser.add_argument("--obstacles", type=int, default=NUM_OBSTACLES)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--strips", type=int, default=None)
+    parser.add_argument("--move-backend", choices=("python", "numba"), default=None,
+                        help="resolución de movimientos (por defecto numba si está instalado)")
+    parser.add_argument("--serial-moves", action="store_true",
+                        help="mueve los peces en el proceso principal, como CellularAutomaton")
+    args = parser.parse_args()
+
+    with ParallelAutomaton(args.width, args.height, args.fish, args.predators, args.obstacles,
+                           seed=args.seed, move_backend=args.move_backend, workers=args.workers,
+                           strips=args.strips, strip_moves=not args.serial_moves) as automaton:
+        start_time = time.time()
+        for _ in range(args.steps):
+            automaton.update()
+        elapsed = time.time() - start_time
+    print(f"{args.steps} pasos en {elapsed:.2f}s ({args.steps / elapsed:.1f} pasos/s) "
+          f"con {automaton.workers} procesos y {len(automaton.strips)} franjas")
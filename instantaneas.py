@@ -0,0 +1,140 @@
+"""Coordenadas por estado de un volumen para los visores 3D de matplotlib.
+
+coordenadas() recorre el volumen una sola vez con numpy y devuelve, para
+cada estado pedido, los arrays (xs, ys, zs) de sus celdas en el mismo orden
+que un recorrido i, j, k, así que dibujar cuesta en proporción a las celdas
+ocupadas y no al volumen. artistas() crea un scatter vacío por estado que se
+reutiliza en cada cuadro y actualizar() les pasa las coordenadas nuevas sin
+crear ni borrar artistas.
+
+Con muchas celdas ocupadas el scatter de mplot3d se vuelve inmanejable:
+detalle() limita el total de puntos a un presupuesto agrupando las celdas en
+bloques de k³ (un marcador por bloque ocupado, con el área según cuánto del
+bloque está ocupado), así que el coste de cada cuadro queda acotado sea cual
+sea el volumen.
+
+Ejemplo:
+    estilos = {TUMOR1: {"c": "green", "s": 30}}
+    artistas = instantaneas.artistas(ax, estilos)
+    for paso in range(pasos):
+        sim.simular_paso()
+        coords, tamaños, lado = instantaneas.detalle(instantaneas.coordenadas(sim.grid, estilos), estilos)
+        instantaneas.actualizar(artistas, coords, tamaños)
+        plt.pause(0.1)
+"""
+import matplotlib as mpl
+import numpy as np
+
+_VACIO = (np.zeros(0, dtype=np.intp),) * 3
+
+# Puntos que se dibujan como mucho por cuadro entre todos los estados
+PRESUPUESTO = 20_000
+
+
+def coordenadas(grid, estados, fondo=0):
+    """Diccionario estado -> (xs, ys, zs) con las celdas de cada estado de `estados`.
+
+    Las celdas con valor `fondo` no se miran; un estado sin celdas da arrays vacíos.
+    """
+    planas = grid.reshape(-1)
+    ocupadas = np.flatnonzero(planas != fondo)
+    valores = planas[ocupadas]
+    # Orden estable: dentro de cada estado las celdas siguen en orden i, j, k
+    orden = np.argsort(valores, kind="stable")
+    valores = valores[orden]
+    ejes = np.unravel_index(ocupadas[orden], grid.shape)
+    resultado = {}
+    for estado in estados:
+        inicio = np.searchsorted(valores, estado, side="left")
+        fin = np.searchsorted(valores, estado, side="right")
+        resultado[estado] = tuple(eje[inicio:fin] for eje in ejes)
+    return resultado
+
+
+def _tamaño_base(parametros):
+    return float(parametros.get("s", mpl.rcParams["lines.markersize"] ** 2))
+
+
+def _bloques(xs, ys, zs, lado):
+    """Bloques de lado³ ocupados: índices (bx, by, bz) y celdas de cada uno"""
+    ejes = [np.asarray(eje, dtype=np.intp) // lado for eje in (xs, ys, zs)]
+    dimensiones = tuple(int(eje.max()) + 1 for eje in ejes)
+    unicos, cuentas = np.unique(np.ravel_multi_index(ejes, dimensiones), return_counts=True)
+    return np.unravel_index(unicos, dimensiones), cuentas
+
+
+def detalle(coordenadas, estilos, presupuesto=PRESUPUESTO):
+    """Reduce coordenadas (estado -> (xs, ys, zs)) a como mucho `presupuesto` puntos.
+
+    Devuelve (coordenadas, tamaños, lado): tamaños es estado -> área de cada
+    marcador para ax.scatter, y lado el de los bloques (1 si las celdas
+    caben tal cual y se devuelven sin tocar). Si no caben se usa el menor
+    lado con el que caben los bloques ocupados de todos los estados: cada
+    uno es un punto en el centro del bloque, con el área del estilo por lado²
+    y por la fracción ocupada^(2/3), así que un bloque lleno se ve como sus
+    celdas juntas. Con presupuesto None no se reduce nada.
+
+    Cada estado con celdas conserva al menos un bloque, así que el
+    presupuesto nunca baja del número de estados con celdas.
+    """
+    total = sum(len(xyz[0]) for xyz in coordenadas.values())
+    con_celdas = [estado for estado, xyz in coordenadas.items() if len(xyz[0])]
+    if presupuesto is not None:
+        presupuesto = max(presupuesto, len(con_celdas))
+    if presupuesto is None or total <= presupuesto:
+        tamaños = {estado: np.array([_tamaño_base(estilos[estado])]) for estado in coordenadas}
+        return coordenadas, tamaños, 1
+
+    # Con un bloque que cubre toda la extensión ocupada cada estado es un
+    # solo punto: el lado no necesita crecer más
+    extension = max(int(eje.max()) + 1 for estado in con_celdas for eje in coordenadas[estado])
+    # El menor lado posible si las celdas llenaran sus bloques; se sube
+    # mientras los bloques ocupados no quepan
+    lado = min(max(2, int(np.ceil((total / presupuesto) ** (1 / 3)))), extension)
+    while True:
+        bloques = {estado: _bloques(*coordenadas[estado], lado) for estado in con_celdas}
+        ocupados = sum(len(cuentas) for _, cuentas in bloques.values())
+        if ocupados <= presupuesto or lado >= extension:
+            break
+        lado = min(max(lado + 1, int(lado * (ocupados / presupuesto) ** (1 / 3))), extension)
+
+    reducidas, tamaños = {}, {}
+    for estado in coordenadas:
+        if estado not in bloques:
+            reducidas[estado] = _VACIO
+            tamaños[estado] = np.array([_tamaño_base(estilos[estado])])
+            continue
+        indices, cuentas = bloques[estado]
+        reducidas[estado] = tuple(indice * lado + (lado - 1) / 2 for indice in indices)
+        ocupacion = cuentas / lado**3
+        tamaños[estado] = _tamaño_base(estilos[estado]) * lado**2 * ocupacion ** (2 / 3)
+    return reducidas, tamaños, lado
+
+
+def artistas(ax, estilos, coordenadas=None, tamaños=None):
+    """Un scatter 3D vacío por estado; estilos es estado -> argumentos de ax.scatter.
+
+    Con `coordenadas` (para una figura que no se va a actualizar) solo se
+    crean los de los estados que tienen celdas, ya con ellas (y con los
+    `tamaños` de detalle() si se pasan), así que la leyenda no muestra
+    estados ausentes.
+    """
+    if coordenadas is None:
+        return {estado: ax.scatter([], [], [], **parametros) for estado, parametros in estilos.items()}
+    creados = {}
+    for estado, parametros in estilos.items():
+        if not len(coordenadas.get(estado, _VACIO)[0]):
+            continue
+        if tamaños is not None:
+            parametros = {**parametros, "s": tamaños[estado]}
+        creados[estado] = ax.scatter(*coordenadas[estado], **parametros)
+    return creados
+
+
+def actualizar(artistas, coordenadas, tamaños=None):
+    """Pone en cada artista las coordenadas de su estado (vacío si no aparece)
+    y, si se pasan, los tamaños de detalle()"""
+    for estado, artista in artistas.items():
+        artista._offsets3d = coordenadas.get(estado, _VACIO)
+        if tamaños is not None and estado in tamaños:
+            artista.set_sizes(tamaños[estado])
@@ -0,0 +1,164 @@
+"""Núcleos compilados con Numba para las partes secuenciales de los cardúmenes.
+
+La resolución de movimientos (cada pez ocupa la primera celda libre en el
+orden de turnos, y la siguiente depende de las anteriores) no se puede
+vectorizar sin cambiar el resultado. Estas funciones la hacen con los mismos
+pasos que los bucles en Python de FinalSimulaiconCardumen y 3dcardumenPeces,
+sobre arrays de enteros, y dan exactamente el mismo resultado.
+
+contar_grupos_2d cuenta los grupos de peces de una pasada con unión-búsqueda,
+en lugar de propagar etiquetas con la grilla entera hasta que no cambien.
+
+Numba es opcional: si no está instalado DISPONIBLE es False y los módulos
+siguen usando sus bucles en Python.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+    DISPONIBLE = True
+except ImportError:
+    DISPONIBLE = False
+
+    def njit(*args, **kwargs):
+        # Sin Numba las funciones quedan como Python normal (lentas, pero
+        # válidas); los módulos no las eligen en ese caso
+        if args and callable(args[0]):
+            return args[0]
+        return lambda funcion: funcion
+
+# Tipos de celda, los mismos valores en los dos cardúmenes
+EMPTY = 0
+FISH = 1
+
+# Orden en que se prueban las direcciones alternativas en 2D (0 es la deseada)
+DESPLAZAMIENTOS_2D = np.array([0, 1, -1, 2, -2, 3, -3, 4, -4], dtype=np.int64)
+
+# Mitad de la vecindad de 8 en 2D como (dx, dy): unir cada celda con estas
+# cuatro vecinas cubre también las otras cuatro relaciones
+MEDIA_VECINDAD_2D = np.array([(1, 0), (-1, 1), (0, 1), (1, 1)], dtype=np.int64)
+
+# Variantes de la dirección (dx, dy, dz) que prueba un pez en 3D, como
+# factores por eje: 1 la mantiene, 0 la anula y -1 la invierte
+VARIANTES_3D = np.array([
+    (1, 1, 1),
+    (1, 1, 0), (1, 0, 1), (0, 1, 1),
+    (1, 0, 0), (0, 1, 0), (0, 0, 1),
+    (-1, 1, 1), (1, -1, 1), (1, 1, -1),
+], dtype=np.int64)
+
+
+def elegir(motor):
+    """Motor de movimiento efectivo: None elige "numba" si está disponible"""
+    if motor is None:
+        return "numba" if DISPONIBLE else "python"
+    if motor not in ("python", "numba"):
+        raise ValueError(f"Motor de movimiento desconocido: {motor!r} (opciones: python, numba)")
+    if motor == "numba" and not DISPONIBLE:
+        raise ImportError("El motor de movimiento 'numba' necesita numba instalado")
+    return motor
+
+
+def sin_compilar(nucleo):
+    """El núcleo como función de Python normal (sin Numba ya lo es)"""
+    return getattr(nucleo, "py_func", nucleo)
+
+
+@njit(cache=True)
+def mover_peces_2d(new_grid, new_directions, xs, ys, direction_dx, direction_dy):
+    """Mueve los peces (xs[i], ys[i]) en ese orden sobre new_grid (alto, ancho, 2).
+
+    Igual que el paso 3 de CellularAutomaton.update: la dirección deseada,
+    luego las alternativas de DESPLAZAMIENTOS_2D y, si todas están ocupadas,
+    quedarse en su celda si sigue libre.
+    """
+    height, width = new_grid.shape[0], new_grid.shape[1]
+    for i in range(len(xs)):
+        x, y = xs[i], ys[i]
+        new_dir = np.int64(new_directions[y, x])
+        moved = False
+        for k in range(len(DESPLAZAMIENTOS_2D)):
+            alt_dir = (new_dir + DESPLAZAMIENTOS_2D[k]) % 8
+            alt_x = (x + direction_dx[alt_dir]) % width
+            alt_y = (y + direction_dy[alt_dir]) % height
+            if new_grid[alt_y, alt_x, 0] == EMPTY:
+                new_grid[alt_y, alt_x, 0] = FISH
+                new_grid[alt_y, alt_x, 1] = alt_dir
+                moved = True
+                break
+        if not moved and new_grid[y, x, 0] == EMPTY:
+            new_grid[y, x, 0] = FISH
+            new_grid[y, x, 1] = new_dir
+
+
+@njit(cache=True)
+def mover_peces_3d(new_grid, indice_peces, posiciones, direcciones, nuevas_posiciones):
+    """Mueve los peces en orden de índice sobre new_grid, como simular_paso.
+
+    Cada pez prueba su dirección y las VARIANTES_3D; si todas están ocupadas
+    se queda en su celda (aunque otro pez ya la haya tomado). indice_peces
+    guarda el primer pez que llega a cada celda.
+    """
+    tamaño = new_grid.shape[0]
+    for idx in range(len(posiciones)):
+        x, y, z = np.int64(posiciones[idx, 0]), np.int64(posiciones[idx, 1]), np.int64(posiciones[idx, 2])
+        dx, dy, dz = np.int64(direcciones[idx, 0]), np.int64(direcciones[idx, 1]), np.int64(direcciones[idx, 2])
+        nx, ny, nz = x, y, z
+        for k in range(len(VARIANTES_3D)):
+            ax = (x + dx * VARIANTES_3D[k, 0]) % tamaño
+            ay = (y + dy * VARIANTES_3D[k, 1]) % tamaño
+            az = (z + dz * VARIANTES_3D[k, 2]) % tamaño
+            if new_grid[ax, ay, az] == EMPTY:
+                nx, ny, nz = ax, ay, az
+                break
+        new_grid[nx, ny, nz] = FISH
+        if indice_peces[nx, ny, nz] < 0:
+            indice_peces[nx, ny, nz] = idx
+        nuevas_posiciones[idx, 0] = nx
+        nuevas_posiciones[idx, 1] = ny
+        nuevas_posiciones[idx, 2] = nz
+
+
+@njit(cache=True)
+def _raiz(padres, i):
+    # Raíz del conjunto de i, acortando el camino a la mitad por el recorrido
+    while padres[i] != i:
+        padres[i] = padres[padres[i]]
+        i = padres[i]
+    return i
+
+
+@njit(cache=True)
+def contar_grupos_2d(tipos, padres):
+    """Grupos de peces conectados en cada mundo de tipos (mundos, alto, ancho).
+
+    Vecindad de 8 con vuelta toroidal, como cluster_count en
+    FinalSimulaiconCardumen. padres es un array de enteros de alto * ancho
+    elementos que se usa como bosque de unión-búsqueda (se sobrescribe).
+    """
+    mundos, height, width = tipos.shape
+    grupos = np.zeros(mundos, dtype=np.int64)
+    for m in range(mundos):
+        cuenta = 0
+        for y in range(height):
+            for x in range(width):
+                i = y * width + x
+                padres[i] = i
+                if tipos[m, y, x] == FISH:
+                    cuenta += 1
+        for y in range(height):
+            for x in range(width):
+                if tipos[m, y, x] != FISH:
+                    continue
+                for k in range(len(MEDIA_VECINDAD_2D)):
+                    nx = (x + MEDIA_VECINDAD_2D[k, 0]) % width
+                    ny = (y + MEDIA_VECINDAD_2D[k, 1]) % height
+                    if tipos[m, ny, nx] != FISH:
+                        continue
+                    a = _raiz(padres, y * width + x)
+                    b = _raiz(padres, ny * width + nx)
+                    if a != b:
+                        padres[max(a, b)] = min(a, b)
+                        cuenta -= 1
+        grupos[m] = cuenta
+    return grupos
@@ -0,0 +1,192 @@
+"""Medición por fases de los pasos de las simulaciones.
+
+Un Perfil se asigna a una simulación (CellularAutomaton.profiler,
+SimulationVisualizer.profiler, EstadoCardumen.perfil, SimulacionTumor.perfil
+o el argumento `perfil` de simular_paso_3d) y cada paso instrumentado abre un
+registro con iniciar(ámbito), marca el final de cada fase con fase(nombre) y
+lo cierra con terminar(**conteos). Cada registro guarda el tiempo de cada
+fase, la memoria que quedó reservada al terminarla ("memoria", en bytes) y
+la máxima que llegó a reservar por encima de la del inicio ("pico"; ahí se
+ven las copias y los arrays temporales que se liberan dentro de la fase), y
+los conteos de entidades. Va a un búfer circular con los últimos
+`capacidad` registros y, si se da un archivo, a una línea JSON.
+
+La memoria se mide con tracemalloc, que ve tanto los objetos de Python como
+los búferes de numpy; el Perfil lo activa al crearse (si no estaba activo) y
+lo para en cerrar(). Mientras está activo las reservas de memoria van más
+lentas, así que los tiempos con perfil son algo mayores que sin él.
+
+Las simulaciones empiezan con NULO, un perfil que no mide nada, y llaman a
+sus métodos sin comprobar si hay perfil; cada fase cuesta una llamada vacía.
+
+Los registros se pueden anidar (un cuadro del visor contiene el paso del
+autómata y el dibujo) y cada hilo lleva su propia pila, así que el autómata
+en un SimulationWorker y el visor pueden compartir el mismo Perfil. La
+memoria es la de todo el proceso: con varios hilos a la vez cada fase ve
+también lo que reservan los otros.
+
+Ejemplo:
+    with Perfil(archivo="perfil.jsonl") as perfil:
+        automata.profiler = perfil
+        for _ in range(100):
+            automata.update()
+        print(perfil.resumen())
+"""
+import collections
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class Perfil:
+    def __init__(self, capacidad=1000, archivo=None):
+        self.registros = collections.deque(maxlen=capacidad)
+        self._pilas = threading.local()
+        self._pasos = collections.Counter()
+        self._cerrojo = threading.Lock()
+        self._archivo = open(archivo, "w", encoding="utf-8") if isinstance(archivo, str) else archivo
+        self._propio = isinstance(archivo, str)
+        # tracemalloc se para al cerrar solo si lo activó este Perfil
+        self._traza = not tracemalloc.is_tracing()
+        if self._traza:
+            tracemalloc.start()
+
+    def _pila(self):
+        pila = getattr(self._pilas, "pila", None)
+        if pila is None:
+            pila = self._pilas.pila = []
+        return pila
+
+    def _memoria(self, pila):
+        """Memoria actual; el pico desde la marca anterior pasa a todos los
+        registros abiertos del hilo antes de empezar a medir el siguiente"""
+        actual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for registro in pila:
+            registro["_pico"] = max(registro["_pico"], pico)
+        return actual
+
+    def iniciar(self, ambito):
+        """Abre un registro; las fases siguientes de este hilo van a él"""
+        ahora = time.perf_counter()
+        pila = self._pila()
+        actual = self._memoria(pila)
+        pila.append({
+            "ambito": ambito,
+            "fases": {},
+            "memoria": {},
+            "pico": {},
+            "_inicio": ahora,
+            "_marca": ahora,
+            "_memoria": actual,
+            "_pico": actual,
+        })
+
+    def fase(self, nombre):
+        """Cierra la fase `nombre`: lo transcurrido desde la marca anterior.
+
+        Sin registro abierto en este hilo no hace nada (p. ej. present()
+        llamado fuera de un cuadro de run).
+        """
+        ahora = time.perf_counter()
+        pila = self._pila()
+        if not pila:
+            return
+        actual = self._memoria(pila)
+        registro = pila[-1]
+        registro["fases"][nombre] = registro["fases"].get(nombre, 0.0) + ahora - registro["_marca"]
+        registro["memoria"][nombre] = registro["memoria"].get(nombre, 0) + actual - registro["_memoria"]
+        registro["pico"][nombre] = max(registro["pico"].get(nombre, 0), registro["_pico"] - registro["_memoria"])
+        registro["_marca"] = ahora
+        registro["_memoria"] = registro["_pico"] = actual
+
+    def terminar(self, **conteos):
+        """Cierra el registro abierto más reciente con sus conteos de entidades"""
+        ahora = time.perf_counter()
+        registro = self._pila().pop()
+        inicio = registro.pop("_inicio")
+        del registro["_marca"], registro["_memoria"], registro["_pico"]
+        with self._cerrojo:
+            registro["paso"] = self._pasos[registro["ambito"]]
+            self._pasos[registro["ambito"]] += 1
+            registro["total_s"] = ahora - inicio
+            registro["conteos"] = {nombre: int(valor) for nombre, valor in conteos.items()}
+            self.registros.append(registro)
+            if self._archivo is not None:
+                self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        return registro
+
+    def resumen(self):
+        """Por ámbito, en el búfer actual: media en segundos del total y de
+        cada fase y media del pico de memoria de cada fase, en bytes"""
+        with self._cerrojo:
+            registros = list(self.registros)
+        por_ambito = {}
+        for registro in registros:
+            acumulado = por_ambito.setdefault(registro["ambito"],
+                                              {"pasos": 0, "total_s": 0.0, "fases": {}, "pico": {}})
+            acumulado["pasos"] += 1
+            acumulado["total_s"] += registro["total_s"]
+            for nombre, segundos in registro["fases"].items():
+                acumulado["fases"][nombre] = acumulado["fases"].get(nombre, 0.0) + segundos
+                acumulado["pico"][nombre] = acumulado["pico"].get(nombre, 0) + registro["pico"][nombre]
+        for acumulado in por_ambito.values():
+            pasos = acumulado["pasos"]
+            acumulado["total_s"] /= pasos
+            acumulado["fases"] = {nombre: segundos / pasos for nombre, segundos in acumulado["fases"].items()}
+            acumulado["pico"] = {nombre: pico / pasos for nombre, pico in acumulado["pico"].items()}
+        return por_ambito
+
+    def informe(self, salida=sys.stderr):
+        """Escribe el resumen como tabla: ms por paso, porcentaje y pico de
+        memoria de cada fase"""
+        for ambito, acumulado in self.resumen().items():
+            total = acumulado["total_s"]
+            print(f"{ambito}: {total * 1e3:.3f} ms por paso ({acumulado['pasos']} pasos)", file=salida)
+            for nombre, segundos in acumulado["fases"].items():
+                print(f"  {nombre:<14} {segundos * 1e3:10.3f} ms {segundos / total if total else 0:7.1%}"
+                      f" {acumulado['pico'][nombre] / 2**20:10.2f} MB", file=salida)
+
+    def cerrar(self):
+        if self._archivo is not None:
+            if self._propio:
+                self._archivo.close()
+            else:
+                self._archivo.flush()
+            self._archivo = None
+        if self._traza and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._traza = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class _PerfilNulo:
+    """Perfil que no mide nada: el de las simulaciones a las que no se les asigna uno"""
+
+    def iniciar(self, ambito):
+        pass
+
+    def fase(self, nombre):
+        pass
+
+    def terminar(self, **conteos):
+        pass
+
+    def resumen(self):
+        return {}
+
+    def informe(self, salida=sys.stderr):
+        pass
+
+    def cerrar(self):
+        pass
+
+
+NULO = _PerfilNulo()
@@ -0,0 +1,430 @@
+"""Mediciones de rendimiento de los núcleos y visores de las simulaciones.
+
+Cada caso prepara su estado con una semilla fija y mide una función sin
+argumentos (un paso, una llamada a un cálculo de vecindad, un cuadro...) en
+un barrido de tamaños y poblaciones, así que al comparar los tiempos de un
+mismo caso se ve cómo escala. La preparación no entra en la medición, y la
+primera llamada tampoco (compila los núcleos de Numba y llena cachés).
+
+Los resultados se pueden guardar como línea base en un JSON y comparar
+después contra ella; los casos que se vuelven más lentos que la tolerancia
+se marcan como regresión y el programa sale con código 1.
+
+Uso:
+    python rendimiento.py                                   # mide y muestra la tabla
+    python rendimiento.py --rapido --filtro 2d.             # solo el tamaño menor de los casos 2D
+    python rendimiento.py --guardar rendimiento_base.json   # nueva línea base
+    python rendimiento.py --comparar rendimiento_base.json --tolerancia 0.25
+    python rendimiento.py --grafica escalado.png            # curvas de escalado por caso
+"""
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+# Las mediciones nunca abren ventanas
+os.environ.setdefault("MPLBACKEND", "Agg")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+import FinalSimulaiconCardumen as cardumen2d
+import franjasCardumen
+import instantaneas
+import nucleos
+import simulacion
+
+cardumen3d = importlib.import_module("3dcardumenPeces")
+
+SEMILLA = 1234
+
+# Casos registrados: nombre -> (preparar, barrido completo, barrido rápido)
+CASOS = {}
+
+# Liberaciones pendientes del caso que se está midiendo (ver al_terminar)
+_LIBERAR = []
+
+
+class Omitido(Exception):
+    """El caso no se puede medir aquí (falta una dependencia opcional)"""
+
+
+def caso(nombre, barrido, rapido=None):
+    """Registra preparar(**parametros), que devuelve la función a medir"""
+    def registrar(preparar):
+        CASOS[nombre] = (preparar, barrido, rapido if rapido is not None else barrido[:1])
+        return preparar
+    return registrar
+
+
+def al_terminar(liberar):
+    """Registra liberar() para cuando acabe la medición del caso en preparación
+
+    Para los casos que abren procesos o memoria compartida: se llama aunque
+    la preparación o la medición fallen, en orden inverso al de registro.
+    """
+    _LIBERAR.append(liberar)
+
+
+def barrido(**ejes):
+    """Producto cartesiano de los valores de cada eje como lista de dicts"""
+    nombres = list(ejes)
+    return [dict(zip(nombres, valores)) for valores in itertools.product(*ejes.values())]
+
+
+def clave(nombre, parametros):
+    return f"{nombre}[{','.join(f'{k}={v}' for k, v in parametros.items())}]"
+
+
+def medir(funcion, repeticiones=5, minimo=0.05):
+    """Segundos por llamada: mínimo y mediana de `repeticiones` tandas.
+
+    Cada tanda repite la función las veces necesarias para durar al menos
+    `minimo` segundos, como timeit.autorange.
+    """
+    funcion()
+    numero = 1
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(numero):
+            funcion()
+        duracion = time.perf_counter() - inicio
+        if duracion >= minimo:
+            break
+        numero = numero * 10 if duracion == 0 else max(numero + 1, int(numero * minimo * 1.2 / duracion))
+    tiempos = [duracion / numero]
+    for _ in range(repeticiones - 1):
+        inicio = time.perf_counter()
+        for _ in range(numero):
+            funcion()
+        tiempos.append((time.perf_counter() - inicio) / numero)
+    return {"llamadas": numero, "minimo_s": min(tiempos), "mediana_s": statistics.median(tiempos)}
+
+
+# Cardumen 2D
+
+def _automata(lado, densidad=0.1, engine="scalar", move_backend="python"):
+    try:
+        return cardumen2d.CellularAutomaton(lado, lado, int(lado * lado * densidad), max(1, lado // 10),
+                                            lado // 5, engine=engine, seed=SEMILLA,
+                                            move_backend=move_backend)
+    except ImportError as error:
+        raise Omitido(str(error))
+
+
+@caso("2d.update",
+      barrido(lado=[50, 100, 200], engine=["scalar", "vectorized"], move_backend=["python", "numba"]),
+      barrido(lado=[50], engine=["scalar", "vectorized"], move_backend=["python"]))
+def _update_2d(lado, engine, move_backend):
+    return _automata(lado, engine=engine, move_backend=move_backend).update
+
+
+@caso("2d.calculate_new_direction", barrido(densidad=[0.05, 0.2, 0.5]))
+def _nueva_direccion_2d(densidad):
+    automata = _automata(100, densidad)
+    ys, xs = np.nonzero(automata.types == cardumen2d.FISH)
+    peces = itertools.cycle(list(zip(xs.tolist(), ys.tolist())))
+    return lambda: automata.calculate_new_direction(*next(peces))
+
+
+@caso("2d.get_neighbors", barrido(radio=[1, 2, 3]))
+def _vecinos_2d(radio):
+    automata = _automata(100)
+    celdas = itertools.cycle([(x, y) for y in range(0, 100, 7) for x in range(0, 100, 3)])
+    return lambda: automata.get_neighbors(*next(celdas), radio)
+
+
+@caso("2d.direction_field", barrido(lado=[100, 200, 400]))
+def _campo_direcciones_2d(lado):
+    automata = _automata(lado)
+    return lambda: cardumen2d.direction_field(automata.types, automata.directions, out=automata._directions)
+
+
+def comprobar_grupos(semilla=SEMILLA):
+    """Comprueba que los dos backends de cluster_count cuentan lo mismo.
+
+    Grillas periódicas al azar de varias formas (también de una o dos
+    celdas de lado, donde la vuelta toroidal junta vecinos) y densidades, y
+    mundos apilados; lanza AssertionError en la primera diferencia.
+    """
+    rng = np.random.default_rng(semilla)
+    for forma in [(1, 1), (2, 2), (1, 7), (2, 9), (5, 1), (17, 23), (64, 64), (3, 4, 20, 30)]:
+        for densidad in [0.1, 0.3, 0.45, 0.6, 0.9]:
+            grid = np.zeros(forma + (2,), dtype=cardumen2d.GRID_DTYPE)
+            grid[..., 0] = np.where(rng.random(forma) < densidad, cardumen2d.FISH,
+                                    rng.choice([cardumen2d.EMPTY, cardumen2d.PREDATOR], forma, p=[0.95, 0.05]))
+            esperado = cardumen2d.cluster_count(grid, backend="python")
+            obtenido = cardumen2d.cluster_count(grid, backend="numba")
+            assert np.array_equal(esperado, obtenido), \
+                f"cluster_count difiere en {forma} con densidad {densidad}: {esperado} != {obtenido}"
+
+
+@caso("2d.cluster_count",
+      barrido(densidad=[0.1, 0.3, 0.45], backend=["python", "numba"]),
+      barrido(densidad=[0.3], backend=["python", "numba"]))
+def _grupos_2d(densidad, backend):
+    try:
+        nucleos.elegir(backend)
+    except ImportError as error:
+        raise Omitido(str(error))
+    if backend == "numba":
+        comprobar_grupos()
+    automata = _automata(200, densidad)
+    return lambda: cardumen2d.cluster_count(automata.grid, backend=backend)
+
+
+@caso("2d.parallel_update",
+      barrido(lado=[200, 1000, 2000], workers=[1, 2, 4, 8, 16]),
+      barrido(lado=[200], workers=[1, 2]))
+def _update_paralelo_2d(lado, workers):
+    # Siempre 16 franjas: con la misma semilla todas las medidas hacen el
+    # mismo trabajo y solo cambia entre cuántos procesos se reparte
+    automata = franjasCardumen.ParallelAutomaton(lado, lado, int(lado * lado * 0.1), max(1, lado // 10),
+                                                 lado // 5, seed=SEMILLA, workers=workers, strips=16)
+    al_terminar(automata.close)
+    return automata.update
+
+
+# Cardumen 3D
+
+def _cardumen(tamaño, peces, motor="python"):
+    try:
+        estado = cardumen3d.EstadoCardumen(tamaño, motor_movimiento=motor)
+    except ImportError as error:
+        raise Omitido(str(error))
+    random.seed(SEMILLA)
+    cardumen3d.inicializar_entidades(peces, max(1, peces // 20), max(1, peces // 5), estado)
+    return estado
+
+
+def _peces(tamaño):
+    """La densidad del script: 100 peces en un espacio de 25³"""
+    return round(100 * (tamaño / 25) ** 3)
+
+
+@caso("3d.simular_paso",
+      barrido(tamaño=[15, 25, 40], motor=["python", "numba"]),
+      barrido(tamaño=[15], motor=["python"]))
+def _paso_3d(tamaño, motor):
+    estado = _cardumen(tamaño, _peces(tamaño), motor)
+    return lambda: cardumen3d.simular_paso(estado)
+
+
+@caso("3d.calcular_alineacion", barrido(peces=[100, 400, 1600]))
+def _alineacion_3d(peces):
+    estado = _cardumen(25, peces)
+    turnos = itertools.cycle(list(enumerate(map(tuple, estado.posiciones.tolist()))))
+
+    def alinear():
+        idx, pos = next(turnos)
+        return cardumen3d.calcular_alineacion(pos, idx, estado)
+    return alinear
+
+
+# Tumor 3D
+
+def _tumor(tamaño, motor):
+    sim = simulacion.SimulacionTumor(tamaño, SEMILLA, motor)
+    # Unos pasos para que el tumor tenga migratorias y frontera
+    for _ in range(10):
+        sim.simular_paso()
+    return sim
+
+
+@caso("tumor.simular_paso_3d", barrido(tamaño=[25, 50, 100]))
+def _paso_tumor(tamaño):
+    # Siempre el mismo paso sobre el mismo grid: la población no crece entre tandas
+    sim = _tumor(tamaño, "referencia")
+    return lambda: simulacion.simular_paso_3d(sim.grid, random.Random(SEMILLA), sim.activas)
+
+
+@caso("tumor.simular_paso_vectorizado", barrido(tamaño=[25, 50, 100]))
+def _paso_tumor_vectorizado(tamaño):
+    sim = _tumor(tamaño, "vectorizado")
+    return lambda: simulacion.simular_paso_vectorizado(sim.grid, np.random.default_rng(SEMILLA))
+
+
+# Visores: recogida de coordenadas y dibujo
+
+@caso("visor.tumor_coordenadas", barrido(tamaño=[25, 50, 100]))
+def _coordenadas_tumor(tamaño):
+    grid = _tumor(tamaño, "vectorizado").grid
+    return lambda: simulacion.coordenadas_por_estado(grid)
+
+
+@caso("visor.cardumen_3d_coordenadas", barrido(tamaño=[25, 40, 80]))
+def _coordenadas_cardumen_3d(tamaño):
+    # Lo que hace reproducir en cada cuadro con el grid grabado
+    grid = _cardumen(tamaño, _peces(tamaño)).grid
+    return lambda: instantaneas.coordenadas(grid, cardumen3d.ESTILOS)
+
+
+@caso("visor.pygame_2d",
+      barrido(lado=[50, 100], render_mode=["full", "dirty", "array"]),
+      barrido(lado=[50], render_mode=["full", "dirty", "array"]))
+def _dibujo_2d(lado, render_mode):
+    try:
+        cardumen2d._import_pygame()
+    except ImportError as error:
+        raise Omitido(str(error))
+    automata = _automata(lado, engine="vectorized")
+    visor = cardumen2d.SimulationVisualizer(automata, cell_size=8, render_mode=render_mode)
+    # Dos pasos consecutivos alternados: en modo "dirty" cada cuadro
+    # redibuja lo que cambia en un paso
+    cuadros = itertools.cycle([automata.grid.copy(), (automata.update(), automata.grid.copy())[1]])
+    if render_mode == "dirty":
+        return lambda: visor.draw_dirty(next(cuadros))
+    if render_mode == "array":
+        return lambda: visor.draw_array(next(cuadros))
+    return lambda: visor.draw_grid(next(cuadros))
+
+
+@caso("visor.pygame_densidad",
+      barrido(lado=[500, 1000], tile=[2, 4, 16]),
+      barrido(lado=[500], tile=[4]))
+def _densidad_2d(lado, tile):
+    try:
+        cardumen2d._import_pygame()
+    except ImportError as error:
+        raise Omitido(str(error))
+    automata = _automata(lado, engine="vectorized")
+    visor = cardumen2d.SimulationVisualizer(automata, cell_size=1)
+    # Mosaicos de la grilla entera, como con la cámara alejada del todo
+    visor.tile = tile
+    return lambda: visor.draw_density(automata.grid)
+
+
+def ejecutar(filtro=None, rapido=False, repeticiones=5, salida=sys.stdout):
+    """Mide los casos cuyo nombre contiene `filtro` y devuelve {clave: resultado}"""
+    resultados = {}
+    for nombre, (preparar, completo, reducido) in CASOS.items():
+        if filtro and filtro not in nombre:
+            continue
+        for parametros in (reducido if rapido else completo):
+            etiqueta = clave(nombre, parametros)
+            try:
+                funcion = preparar(**parametros)
+                resultado = medir(funcion, repeticiones)
+            except Omitido as motivo:
+                print(f"{etiqueta:<70} omitido ({motivo})", file=salida)
+                continue
+            finally:
+                while _LIBERAR:
+                    _LIBERAR.pop()()
+            resultado.update(caso=nombre, parametros=parametros)
+            resultados[etiqueta] = resultado
+            print(f"{etiqueta:<70} {resultado['mediana_s'] * 1e3:>11.3f} ms "
+                  f"(mín {resultado['minimo_s'] * 1e3:.3f}, {resultado['llamadas']} llamadas)",
+                  file=salida, flush=True)
+    return resultados
+
+
+def entorno():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": nucleos.DISPONIBLE,
+        "plataforma": platform.platform(),
+        "procesador": platform.processor() or platform.machine(),
+        "nucleos": os.cpu_count(),
+    }
+
+
+def guardar(resultados, ruta):
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump({"entorno": entorno(), "resultados": resultados}, archivo, indent=2, ensure_ascii=False)
+        archivo.write("\n")
+
+
+def comparar(resultados, ruta, tolerancia=0.25, salida=sys.stdout):
+    """Compara medianas con la línea base; devuelve las claves que empeoraron
+
+    Los casos medidos que no están en la línea base se listan al final, para
+    que un caso nuevo no pase sin comparar.
+    """
+    with open(ruta, encoding="utf-8") as archivo:
+        base = json.load(archivo)["resultados"]
+    regresiones = []
+    sin_base = []
+    for etiqueta, resultado in resultados.items():
+        if etiqueta not in base:
+            sin_base.append(etiqueta)
+            continue
+        razon = resultado["mediana_s"] / base[etiqueta]["mediana_s"]
+        marca = ""
+        if razon > 1 + tolerancia:
+            marca = "  <- regresión"
+            regresiones.append(etiqueta)
+        elif razon < 1 / (1 + tolerancia):
+            marca = "  <- mejora"
+        print(f"{etiqueta:<70} x{razon:6.2f}{marca}", file=salida)
+    if sin_base:
+        print(f"{len(sin_base)} casos sin línea base en {ruta}:", file=salida)
+        for etiqueta in sin_base:
+            print(f"  {etiqueta}", file=salida)
+    return regresiones
+
+
+def graficar(resultados, ruta):
+    """Una curva por caso y combinación de parámetros, frente al primer parámetro del barrido"""
+    import matplotlib.pyplot as plt
+
+    nombres = sorted({resultado["caso"] for resultado in resultados.values()})
+    fig, ejes = plt.subplots(len(nombres), 1, figsize=(8, 3 * len(nombres)), squeeze=False)
+    for ax, nombre in zip(ejes[:, 0], nombres):
+        curvas = {}
+        for resultado in resultados.values():
+            if resultado["caso"] != nombre:
+                continue
+            parametros = dict(resultado["parametros"])
+            eje, valor = next(iter(parametros.items()))
+            del parametros[eje]
+            etiqueta = ", ".join(f"{k}={v}" for k, v in parametros.items()) or nombre
+            curvas.setdefault(etiqueta, []).append((valor, resultado["mediana_s"]))
+        for etiqueta, puntos in curvas.items():
+            valores, tiempos = zip(*sorted(puntos))
+            ax.loglog(valores, tiempos, marker="o", label=etiqueta)
+        ax.set_title(nombre)
+        ax.set_xlabel(eje)
+        ax.set_ylabel("s por llamada")
+        ax.legend(fontsize=8)
+    fig.tight_layout()
+    fig.savefig(ruta)
+    plt.close(fig)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mediciones de rendimiento de las simulaciones")
+    parser.add_argument("--filtro", help="solo los casos cuyo nombre contiene este texto")
+    parser.add_argument("--rapido", action="store_true", help="solo el tamaño menor de cada caso")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--guardar", metavar="ARCHIVO", help="guarda los resultados como línea base")
+    parser.add_argument("--comparar", metavar="ARCHIVO", help="compara con una línea base guardada")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="aumento relativo de la mediana que cuenta como regresión")
+    parser.add_argument("--grafica", metavar="ARCHIVO", help="guarda las curvas de escalado en una imagen")
+    args = parser.parse_args(argv)
+
+    resultados = ejecutar(args.filtro, args.rapido, args.repeticiones)
+    if args.guardar:
+        guardar(resultados, args.guardar)
+        print(f"Línea base guardada en {args.guardar}")
+    if args.grafica:
+        graficar(resultados, args.grafica)
+        print(f"Curvas de escalado en {args.grafica}")
+    if args.comparar:
+        regresiones = comparar(resultados, args.comparar, args.tolerancia)
+        if regresiones:
+            print(f"{len(regresiones)} regresiones con tolerancia {args.tolerancia:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
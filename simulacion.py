@@ -1,9 +1,18 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import json
+import os
 import random
 import time
 
+import instantaneas
+import perfilado
+import trayectorias
+import vecindades
+
 
 TAMAÑO = 25  # Reducido para mejor visualización
 PASOS = 30   # Menos pasos para prueba rápida
@@ -15,36 +24,74 @@ MIGRA2 = 2   # Células migratorias
 DEGRA3 = 3   # Matriz degradada
 META4 = 4    # Micrometástasis
 
-# Inicializar grid 3D
-grid = np.zeros((TAMAÑO, TAMAÑO, TAMAÑO), dtype=np.uint8)
+# Estados que se procesan en cada paso
+ACTIVOS = (TUMOR1, MIGRA2, META4)
+
+# Vecindad de 6, ordenada por índice lineal del vecino (el orden en que el
+# recorrido i, j, k visitaría a las vecinas de una celda)
+VECINOS_6 = vecindades.desplazamientos_tuplas(1, 6)
+
+# Valor del borde al rellenar el grid; no coincide con ningún estado
+FUERA = 255
+
+# Motores de paso disponibles para SimulacionTumor
+MOTORES = ("referencia", "vectorizado")
+
+# Estados que se cuentan en cada paso, en este orden
+ESTADOS_CONTEO = (TUMOR1, MIGRA2, DEGRA3, META4)
+NOMBRES_CONTEO = ("tumor", "migratorias", "degradada", "metastasis")
+
+# Cómo se dibuja cada estado visible en los visores 3D (argumentos de ax.scatter)
+ESTILOS = {
+    TUMOR1: {'c': 'green', 's': 30, 'alpha': 0.8, 'label': 'Tumor primario', 'depthshade': True},
+    MIGRA2: {'c': 'yellow', 's': 20, 'alpha': 0.9, 'label': 'Células migratorias', 'depthshade': True},
+    DEGRA3: {'c': 'brown', 's': 15, 'alpha': 0.7, 'label': 'Matriz degradada', 'depthshade': True},
+    META4: {'c': 'red', 's': 25, 'alpha': 0.9, 'label': 'Metástasis', 'depthshade': True},
+}
 
-# Colocar tumor primario en el centro
-centro = TAMAÑO // 2
-grid[centro-1:centro+2, centro-1:centro+2, centro-1:centro+2] = TUMOR1
-print(f"Tumor inicial: {np.sum(grid == TUMOR1)} células")
 
+def crear_grid(tamaño=TAMAÑO, grid=None):
+    """Tejido sano con el tumor primario (3x3x3) en el centro
 
-def obtener_vecinos_3d(i, j, k, incluir_diagonales=True):
+    Si se pasa `grid` (un volumen ya a cero, p. ej. un memmap recién creado)
+    se escribe el tumor en él en lugar de reservar uno nuevo.
+    """
+    if grid is None:
+        grid = np.zeros((tamaño, tamaño, tamaño), dtype=np.uint8)
+    centro = tamaño // 2
+    grid[centro-1:centro+2, centro-1:centro+2, centro-1:centro+2] = TUMOR1
+    return grid
+
+
+def obtener_vecinos_3d(i, j, k, incluir_diagonales=True, tamaño=TAMAÑO, rng=random):
     """Obtiene vecinos 3D (6 u 26 según configuración)"""
-    vecinos = []
-    rango = [-1, 0, 1]
-    for dx in rango:
-        for dy in rango:
-            for dz in rango:
-                if dx == 0 and dy == 0 and dz == 0:
-                    continue  # Saltar la celda actual
-                if not incluir_diagonales and abs(dx) + abs(dy) + abs(dz) > 1:
-                    continue  # Solo vecinos directos 
-                
-                x, y, z = i + dx, j + dy, k + dz
-                if 0 <= x < TAMAÑO and 0 <= y < TAMAÑO and 0 <= z < TAMAÑO:
-                    vecinos.append((x, y, z))
+    tabla = vecindades.desplazamientos_tuplas(1, 26 if incluir_diagonales else 6)
+    if 0 < i < tamaño - 1 and 0 < j < tamaño - 1 and 0 < k < tamaño - 1:
+        vecinos = [(i + dx, j + dy, k + dz) for dx, dy, dz in tabla]
+    else:
+        vecinos = [(i + dx, j + dy, k + dz) for dx, dy, dz in tabla
+                   if 0 <= i + dx < tamaño and 0 <= j + dy < tamaño and 0 <= k + dz < tamaño]
     
-    random.shuffle(vecinos)
+    rng.shuffle(vecinos)
     return vecinos
 
-def simular_paso_3d(grid):
-    nuevo_grid = grid.copy()
+def simular_paso_3d(grid, rng=random, activas=None, escritas=None, grabador=None, destino=None,
+                    perfil=perfilado.NULO):
+    """Aplica un paso a grid y devuelve (nuevo_grid, cambios)
+
+    Si se pasa `activas` (conjunto de posiciones TUMOR1/MIGRA2/META4) no se
+    recorre el volumen entero. Las posiciones escritas en nuevo_grid se
+    añaden a la lista `escritas` si se pasa una, y nuevo_grid se agrega al
+    `grabador` (trayectorias.Grabador) si se pasa uno. Con `destino` (un
+    volumen con el mismo contenido que grid) el paso se escribe ahí en lugar
+    de en una copia. Con `perfil` (perfilado.Perfil) se registra el tiempo
+    de cada fase del paso.
+    """
+    tamaño = grid.shape[0]
+    perfil.iniciar("simular_paso_3d")
+    if escritas is None:
+        escritas = []
+    nuevo_grid = grid.copy() if destino is None else destino
     cambios = {
         'migracion': 0,
         'degradacion': 0,
@@ -52,13 +99,18 @@ def simular_paso_3d(grid):
         'crecimiento': 0
     }
     
-    # Primera pasada: identificar todas las células activas
-    celulas_activas = []
-    for i in range(TAMAÑO):
-        for j in range(TAMAÑO):
-            for k in range(TAMAÑO):
-                if grid[i, j, k] in [TUMOR1, MIGRA2, META4]:
-                    celulas_activas.append((i, j, k, grid[i, j, k]))
+    # Primera pasada: identificar todas las células activas (ordenadas igual
+    # que el recorrido i, j, k para consumir el generador en el mismo orden)
+    if activas is not None:
+        celulas_activas = [(i, j, k, grid[i, j, k]) for i, j, k in sorted(activas)]
+    else:
+        celulas_activas = []
+        for i in range(tamaño):
+            for j in range(tamaño):
+                for k in range(tamaño):
+                    if grid[i, j, k] in [TUMOR1, MIGRA2, META4]:
+                        celulas_activas.append((i, j, k, grid[i, j, k]))
+    perfil.fase("activas")
     
     # Procesar solo células activas
     for pos in celulas_activas:
@@ -66,94 +118,455 @@ def simular_paso_3d(grid):
         
         # 1. Movimiento de células migratorias
         if celda == MIGRA2:
-            vecinos = obtener_vecinos_3d(i, j, k, incluir_diagonales=False)
+            vecinos = obtener_vecinos_3d(i, j, k, incluir_diagonales=False, tamaño=tamaño, rng=rng)
             
             # Intentar moverse
             for x, y, z in vecinos:
                 if grid[x, y, z] in [SAN0, DEGRA3]:
-                    if random.random() < 0.7:  # Alta probabilidad de movimiento
+                    if rng.random() < 0.7:  # Alta probabilidad de movimiento
                         nuevo_grid[x, y, z] = MIGRA2
                         nuevo_grid[i, j, k] = DEGRA3
+                        escritas.append((x, y, z))
+                        escritas.append((i, j, k))
                         cambios['migracion'] += 1
                         cambios['degradacion'] += 1
                         break
             
             # Intravasación (formación de metástasis)
             if cambios['migracion'] == 0:  # Solo si no se movió
-                if i <= 1 or i >= TAMAÑO-2 or j <= 1 or j >= TAMAÑO-2 or k <= 1 or k >= TAMAÑO-2:
-                    if random.random() < 0.4:  # Mayor probabilidad
+                if i <= 1 or i >= tamaño-2 or j <= 1 or j >= tamaño-2 or k <= 1 or k >= tamaño-2:
+                    if rng.random() < 0.4:  # Mayor probabilidad
                         # Buscar posición aleatoria lejos de bordes
-                        x, y, z = random.randint(3, TAMAÑO-4), random.randint(3, TAMAÑO-4), random.randint(3, TAMAÑO-4)
+                        x, y, z = rng.randint(3, tamaño-4), rng.randint(3, tamaño-4), rng.randint(3, tamaño-4)
                         if nuevo_grid[x, y, z] == SAN0:
                             nuevo_grid[x, y, z] = META4
+                            escritas.append((x, y, z))
                             cambios['metastasis'] += 1
         
         # 2. Crecimiento tumoral
         elif celda in [TUMOR1, META4]:
-            vecinos = obtener_vecinos_3d(i, j, k, incluir_diagonales=False)
+            vecinos = obtener_vecinos_3d(i, j, k, incluir_diagonales=False, tamaño=tamaño, rng=rng)
             for x, y, z in vecinos:
-                if nuevo_grid[x, y, z] == SAN0 and random.random() < 0.3:  # Mayor probabilidad
+                if nuevo_grid[x, y, z] == SAN0 and rng.random() < 0.3:  # Mayor probabilidad
                     nuevo_grid[x, y, z] = celda
+                    escritas.append((x, y, z))
                     cambios['crecimiento'] += 1
         
         # 3. Transición a célula migratoria (EMT)
         elif celda == TUMOR1:
-            vecinos = obtener_vecinos_3d(i, j, k)
+            vecinos = obtener_vecinos_3d(i, j, k, tamaño=tamaño, rng=rng)
             vecinos_tumor = sum(1 for x, y, z in vecinos if grid[x, y, z] in [TUMOR1, MIGRA2])
             
             # Condición más relajada para EMT
-            if vecinos_tumor < 20 and random.random() < 0.15:  # Mayor probabilidad
+            if vecinos_tumor < 20 and rng.random() < 0.15:  # Mayor probabilidad
                 nuevo_grid[i, j, k] = MIGRA2
+                escritas.append((i, j, k))
                 cambios['migracion'] += 1
     
-    print(f"Cambios: Migración={cambios['migracion']}, Degradación={cambios['degradacion']}, "
-          f"Metástasis={cambios['metastasis']}, Crecimiento={cambios['crecimiento']}")
-    return nuevo_grid
+    perfil.fase("reglas")
+    if grabador is not None:
+        grabador.agregar(nuevo_grid)
+    perfil.fase("grabacion")
+    perfil.terminar(activas=len(celulas_activas), escritas=len(escritas), **cambios)
+    return nuevo_grid, cambios
+
+
+def simular_paso_vectorizado(grid, rng, grabador=None, destino=None):
+    """Versión vectorizada de simular_paso_3d con un np.random.Generator
+
+    Aplica las mismas reglas con máscaras sobre el volumen completo en lugar
+    de célula a célula. No consume el generador en el mismo orden, así que no
+    reproduce la trayectoria exacta del bucle, pero sí su distribución:
+    - Crecimiento: una célula sana con n vecinas TUMOR1/META4 crece con
+      probabilidad 1 - 0.7**n y toma el tipo de la primera vecina con éxito
+      en orden de recorrido, como la primera en escribirla en el bucle.
+    - Migración: cada MIGRA2 se mueve con probabilidad 1 - 0.3**n (n destinos
+      sanos o degradados) a uno de los destinos con éxito elegido al azar y
+      deja matriz degradada. Se aplica al final porque en el bucle siempre
+      sobrescribe lo que el crecimiento hubiera puesto en el destino.
+    - Intravasación: solo para las MIGRA2 del borde recorridas antes de la
+      primera que se movió, que es cuando el contador de migración sigue a 0.
+    - EMT: en el bucle la rama de TUMOR1 ya la toma el crecimiento, así que
+      nunca se aplica; aquí tampoco.
+    Devuelve (nuevo_grid, cambios) igual que simular_paso_3d, y como ella
+    escribe en `destino` si se pasa.
+    """
+    tamaño = grid.shape[0]
+    nuevo_grid = grid.copy() if destino is None else destino
+    cambios = {
+        'migracion': 0,
+        'degradacion': 0,
+        'metastasis': 0,
+        'crecimiento': 0
+    }
+    desplazamientos = np.array(VECINOS_6)
+    relleno = np.pad(grid, 1, constant_values=FUERA)
+    vecinos = [relleno[1 + di:1 + di + tamaño, 1 + dj:1 + dj + tamaño, 1 + dk:1 + dk + tamaño]
+               for di, dj, dk in VECINOS_6]
+
+    # 1. Crecimiento tumoral
+    fuentes = [(v == TUMOR1) | (v == META4) for v in vecinos]
+    candidatas = np.nonzero((grid == SAN0) & np.logical_or.reduce(fuentes))
+    if len(candidatas[0]):
+        es_fuente = np.stack([f[candidatas] for f in fuentes], axis=1)
+        exito = es_fuente & (rng.random(es_fuente.shape) < 0.3)
+        crece = exito.any(axis=1)
+        primera = exito.argmax(axis=1)
+        tipos = np.stack([v[candidatas] for v in vecinos], axis=1)
+        tipos = tipos[np.arange(len(primera)), primera]
+        nuevo_grid[tuple(c[crece] for c in candidatas)] = tipos[crece]
+        cambios['crecimiento'] = int(crece.sum())
+
+    migratorias = np.nonzero(grid == MIGRA2)
+    if len(migratorias[0]):
+        origen = np.stack(migratorias, axis=1)
+        libre = np.stack([(v[migratorias] == SAN0) | (v[migratorias] == DEGRA3) for v in vecinos], axis=1)
+        exito = libre & (rng.random(libre.shape) < 0.7)
+        movida = exito.any(axis=1)
+        eleccion = np.where(exito, rng.random(exito.shape), 2.0).argmin(axis=1)
+        destinos_migracion = origen + desplazamientos[eleccion]
+
+        # 2. Intravasación (formación de metástasis)
+        primera_movida = movida.argmax() if movida.any() else len(movida)
+        en_borde = ((origen <= 1) | (origen >= tamaño - 2)).any(axis=1)
+        intenta = en_borde & (np.arange(len(movida)) < primera_movida)
+        intenta &= rng.random(len(movida)) < 0.4
+        if intenta.any():
+            # Posición aleatoria lejos de bordes
+            metastasis = rng.integers(3, tamaño - 3, size=(int(intenta.sum()), 3))
+            metastasis = np.unique(metastasis, axis=0)
+            metastasis = metastasis[nuevo_grid[tuple(metastasis.T)] == SAN0]
+            nuevo_grid[tuple(metastasis.T)] = META4
+            cambios['metastasis'] = len(metastasis)
+
+        # 3. Movimiento de células migratorias
+        nuevo_grid[tuple(destinos_migracion[movida].T)] = MIGRA2
+        nuevo_grid[tuple(origen[movida].T)] = DEGRA3
+        cambios['migracion'] = cambios['degradacion'] = int(movida.sum())
+
+    if grabador is not None:
+        grabador.agregar(nuevo_grid)
+    return nuevo_grid, cambios
+
+
+def mascara_frontera(grid):
+    """Células TUMOR1/META4 con algún vecino sano (vecindad de 6)"""
+    tamaño = grid.shape[0]
+    relleno = np.pad(grid, 1, constant_values=FUERA)
+    vecino_sano = np.zeros(grid.shape, dtype=bool)
+    for di, dj, dk in VECINOS_6:
+        vecino_sano |= relleno[1 + di:1 + di + tamaño, 1 + dj:1 + dj + tamaño, 1 + dk:1 + dk + tamaño] == SAN0
+    return ((grid == TUMOR1) | (grid == META4)) & vecino_sano
+
+
+def grids_mapeados(directorio, tamaño, modo="r+"):
+    """Los dos volúmenes np.memmap de una simulación respaldada en disco.
+
+    Con modo "w+" se crean (a cero) y con "r+" se abren los existentes.
+    """
+    return [
+        np.memmap(os.path.join(directorio, f"grid_{n}.u8"), dtype=np.uint8, mode=modo,
+                  shape=(tamaño, tamaño, tamaño))
+        for n in range(2)
+    ]
+
+
+class SimulacionTumor:
+    """Una simulación independiente: su propio grid y su propio generador.
+
+    Varias instancias pueden convivir en el mismo proceso sin compartir
+    estado, y con la misma semilla reproducen la misma trayectoria.
+
+    Con el motor "referencia" lleva al día el conjunto de células activas,
+    la frontera del tumor (células TUMOR1/META4 con algún vecino sano) y los
+    conteos por estado, así que un paso cuesta en proporción a la población
+    activa y no al volumen. El motor "vectorizado" usa
+    simular_paso_vectorizado con un np.random.Generator; ahí activas y
+    frontera quedan en None (ver mascara_frontera). Si se modifica grid
+    desde fuera hay que llamar a reindexar(). Si se asigna un `grabador`
+    (trayectorias.Grabador) recibe el grid tras cada paso, y si se asigna un
+    `perfil` (perfilado.Perfil) se registra el tiempo de cada fase.
+
+    El grid actual y el siguiente son dos volúmenes que se turnan en cada
+    paso: el paso se escribe sobre el otro volumen, que antes solo se pone al
+    día con las celdas que cambiaron en el paso anterior, así que no se
+    copia ni se reserva el volumen entero. Quien quiera conservar el grid de
+    un paso anterior debe copiarlo.
+
+    Con `directorio` los dos volúmenes son np.memmap en disco. Al terminar
+    cada paso se guarda en estado.json cuál de los dos es el actual junto
+    con el paso y el estado de los generadores;
+    SimulacionTumor.abrir(directorio) continúa desde ahí. Solo el motor
+    "referencia" trabaja en proporción a la población activa: el
+    "vectorizado" crea varias máscaras del volumen entero en cada paso, así
+    que necesita que el volumen quepa en memoria aunque esté en disco.
+    """
+
+    def __init__(self, tamaño=TAMAÑO, semilla=None, motor="referencia", directorio=None):
+        if motor not in MOTORES:
+            raise ValueError(f"Motor desconocido: {motor!r} (opciones: {', '.join(MOTORES)})")
+        self.tamaño = tamaño
+        self.semilla = semilla
+        self.motor = motor
+        self.rng = random.Random(semilla)
+        self.np_rng = np.random.default_rng(semilla)
+        self.paso = 0
+        self.grabador = None
+        self.perfil = perfilado.NULO
+        self.directorio = directorio
+        if directorio is None:
+            self._volumenes = [crear_grid(tamaño), crear_grid(tamaño)]
+        else:
+            os.makedirs(directorio, exist_ok=True)
+            self._volumenes = grids_mapeados(directorio, tamaño, "w+")
+            for volumen in self._volumenes:
+                crear_grid(tamaño, volumen)
+        self._actual = 0
+        self.grid = self._volumenes[0]
+        self.reindexar()
+        # Celdas en que el volumen de reserva difiere del actual (None: todas)
+        self._pendientes = (np.array([], dtype=np.intp),) * 3
+        if directorio is not None:
+            self._guardar_estado()
+
+    @classmethod
+    def abrir(cls, directorio):
+        """Continúa una simulación respaldada en disco desde su último paso completo"""
+        with open(os.path.join(directorio, "estado.json")) as archivo:
+            estado = json.load(archivo)
+        sim = cls.__new__(cls)
+        sim.tamaño = estado["tamaño"]
+        sim.semilla = estado["semilla"]
+        sim.motor = estado["motor"]
+        sim.paso = estado["paso"]
+        sim.rng = random.Random()
+        version, interno, gauss = estado["rng"]
+        sim.rng.setstate((version, tuple(interno), gauss))
+        sim.np_rng = np.random.default_rng()
+        sim.np_rng.bit_generator.state = estado["np_rng"]
+        sim.grabador = None
+        sim.perfil = perfilado.NULO
+        sim.directorio = directorio
+        sim._volumenes = grids_mapeados(directorio, sim.tamaño, "r+")
+        sim._actual = estado["actual"]
+        sim._pendientes = None
+        sim.grid = sim._volumenes[sim._actual]
+        sim.reindexar()
+        return sim
+
+    def _guardar_estado(self):
+        """Vuelca el volumen actual y apunta estado.json a él (escritura atómica)"""
+        self.grid.flush()
+        estado = {
+            "tamaño": self.tamaño,
+            "semilla": self.semilla,
+            "motor": self.motor,
+            "paso": self.paso,
+            "actual": self._actual,
+            "rng": self.rng.getstate(),
+            "np_rng": self.np_rng.bit_generator.state,
+        }
+        ruta = os.path.join(self.directorio, "estado.json")
+        with open(ruta + ".tmp", "w") as archivo:
+            json.dump(estado, archivo)
+        os.replace(ruta + ".tmp", ruta)
+
+    def _reserva(self):
+        """Volumen libre puesto al día con el actual"""
+        reserva = self._volumenes[1 - self._actual]
+        if reserva.shape != self.grid.shape:
+            reserva = self._volumenes[1 - self._actual] = np.empty_like(self.grid)
+            self._pendientes = None
+        if self._pendientes is None:
+            np.copyto(reserva, self.grid)
+        else:
+            reserva[self._pendientes] = self.grid[self._pendientes]
+        return reserva
+
+    def _turnar(self, cambiadas):
+        """Tras un paso escrito en la reserva, la convierte en el volumen actual"""
+        self._actual = 1 - self._actual
+        self._pendientes = cambiadas
+        if self.directorio is not None:
+            self._guardar_estado()
+
+    def reindexar(self):
+        """Reconstruye activas, frontera y conteos recorriendo el grid"""
+        # grid pudo cambiar desde fuera: pasa a ser el volumen actual y la
+        # reserva se copia entera antes del siguiente paso
+        if self.grid is not self._volumenes[self._actual]:
+            if self.directorio is None:
+                self._volumenes[self._actual] = self.grid
+            else:
+                np.copyto(self._volumenes[self._actual], self.grid)
+                self.grid = self._volumenes[self._actual]
+        self._pendientes = None
+        # Plano a plano (i fijo): los temporales son del tamaño de un plano y
+        # no del volumen, que con memmap puede no caber en memoria
+        self._conteos = np.zeros(META4 + 1, dtype=np.int64)
+        activas = None if self.motor == "vectorizado" else set()
+        for i, plano in enumerate(self.grid):
+            self._conteos += np.bincount(plano.ravel(), minlength=META4 + 1)
+            if activas is not None:
+                js, ks = np.nonzero(np.isin(plano, ACTIVOS))
+                activas.update(zip([i] * len(js), js.tolist(), ks.tolist()))
+        if activas is None:
+            self.activas = self.frontera = None
+            return
+        self.activas = activas
+        self.frontera = {pos for pos in self.activas if self._en_frontera(pos)}
+
+    def _en_frontera(self, pos):
+        if self.grid[pos] not in (TUMOR1, META4):
+            return False
+        i, j, k = pos
+        for di, dj, dk in VECINOS_6:
+            x, y, z = i + di, j + dj, k + dk
+            if 0 <= x < self.tamaño and 0 <= y < self.tamaño and 0 <= z < self.tamaño:
+                if self.grid[x, y, z] == SAN0:
+                    return True
+        return False
+
+    def simular_paso(self):
+        perfil = self.perfil
+        perfil.iniciar("SimulacionTumor.simular_paso")
+        reserva = self._reserva()
+        perfil.fase("reserva")
+
+        if self.motor == "vectorizado":
+            viejo_grid = self.grid
+            self.grid, cambios = simular_paso_vectorizado(viejo_grid, self.np_rng, self.grabador, reserva)
+            perfil.fase("paso")
+            cambiadas = np.nonzero(self.grid != viejo_grid)
+            self._conteos -= np.bincount(viejo_grid[cambiadas], minlength=META4 + 1)
+            self._conteos += np.bincount(self.grid[cambiadas], minlength=META4 + 1)
+            self.paso += 1
+            perfil.fase("indices")
+            self._turnar(cambiadas)
+        else:
+            escritas = []
+            viejo_grid = self.grid
+            self.grid, cambios = simular_paso_3d(viejo_grid, self.rng, self.activas, escritas, self.grabador,
+                                                 reserva, perfil)
+            perfil.fase("paso")
+            self._actualizar_indices(viejo_grid, set(escritas))
+            self.paso += 1
+            perfil.fase("indices")
+            if escritas:
+                self._turnar(tuple(np.array(escritas, dtype=np.intp).T))
+            else:
+                self._turnar((np.array([], dtype=np.intp),) * 3)
+
+        perfil.fase("turnar")
+        perfil.terminar(**dict(zip(NOMBRES_CONTEO, self.conteos())))
+        return cambios
+
+    def _actualizar_indices(self, viejo_grid, cambiadas):
+        revisar = set()
+        for pos in cambiadas:
+            antes, ahora = viejo_grid[pos], self.grid[pos]
+            if antes == ahora:
+                continue
+            self._conteos[antes] -= 1
+            self._conteos[ahora] += 1
+            if ahora in ACTIVOS:
+                self.activas.add(pos)
+            else:
+                self.activas.discard(pos)
+            # El cambio puede afectar a la frontera de la celda y de sus vecinas
+            i, j, k = pos
+            revisar.add(pos)
+            revisar.update((i + di, j + dj, k + dk) for di, dj, dk in VECINOS_6)
+        for pos in revisar:
+            if all(0 <= c < self.tamaño for c in pos):
+                if self._en_frontera(pos):
+                    self.frontera.add(pos)
+                else:
+                    self.frontera.discard(pos)
 
+    def conteos(self):
+        """Células de cada estado de ESTADOS_CONTEO"""
+        return self._conteos[list(ESTADOS_CONTEO)].copy()
 
 
-def visualizar_3d(grid, paso):
+def ejecutar_replica(tamaño, pasos, semilla, motor="referencia"):
+    """Corre una réplica completa y devuelve solo los conteos (pasos+1, 4)"""
+    sim = SimulacionTumor(tamaño, semilla, motor)
+    conteos = np.zeros((pasos + 1, len(ESTADOS_CONTEO)), dtype=np.int64)
+    conteos[0] = sim.conteos()
+    for paso in range(1, pasos + 1):
+        sim.simular_paso()
+        conteos[paso] = sim.conteos()
+    return conteos
+
+
+def semillas_replicas(n_replicas, semilla=None):
+    """Semillas independientes para cada réplica derivadas de una semilla base"""
+    hijas = np.random.SeedSequence(semilla).spawn(n_replicas)
+    return [int(hija.generate_state(1)[0]) for hija in hijas]
+
+
+def ensamble(n_replicas, pasos=PASOS, tamaño=TAMAÑO, semilla=None, procesos=None,
+             motor="referencia"):
+    """Reparte las réplicas en un ProcessPoolExecutor y las va entregando al terminar.
+
+    Genera tuplas (réplica, semilla, conteos) en orden de llegada; conteos
+    tiene una fila por paso (incluido el inicial) y una columna por estado
+    de ESTADOS_CONTEO. Los grids nunca salen de los procesos hijos.
+    """
+    semillas = semillas_replicas(n_replicas, semilla)
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        futuros = {
+            executor.submit(ejecutar_replica, tamaño, pasos, s, motor): (replica, s)
+            for replica, s in enumerate(semillas)
+        }
+        for futuro in as_completed(futuros):
+            replica, s = futuros[futuro]
+            yield replica, s, futuro.result()
+
+
+def ejecutar_ensamble(n_replicas, pasos=PASOS, tamaño=TAMAÑO, semilla=None, procesos=None,
+                      motor="referencia"):
+    """Como ensamble pero espera a todas: array (réplicas, pasos+1, 4)"""
+    resultados = np.zeros((n_replicas, pasos + 1, len(ESTADOS_CONTEO)), dtype=np.int64)
+    for replica, _, conteos in ensamble(n_replicas, pasos, tamaño, semilla, procesos, motor):
+        resultados[replica] = conteos
+    return resultados
+
+
+
+def coordenadas_por_estado(grid):
+    """Arrays (xs, ys, zs) de las células de cada estado visible (todos menos SAN0)"""
+    return instantaneas.coordenadas(grid, ESTILOS, fondo=SAN0)
+
+
+def _titulo(paso, coords, lado):
+    """Título de los visores; coords son las de todas las células, sin reducir"""
+    titulo = f'Paso: {paso} - Células Migratorias: {len(coords[MIGRA2][0])}'
+    if lado > 1:
+        titulo += f' (bloques de {lado}³)'
+    return titulo
+
+
+def visualizar_3d(grid, paso, presupuesto=instantaneas.PRESUPUESTO):
+    tamaño = grid.shape[0]
     fig = plt.figure(figsize=(12, 10))
     ax = fig.add_subplot(111, projection='3d')
     
-    # Preparar datos
-    coords = {TUMOR1: [[], [], []], MIGRA2: [[], [], []], 
-              DEGRA3: [[], [], []], META4: [[], [], []]}
-    
-    # Recopilar coordenadas
-    for i in range(TAMAÑO):
-        for j in range(TAMAÑO):
-            for k in range(TAMAÑO):
-                estado = grid[i, j, k]
-                if estado in coords:
-                    coords[estado][0].append(i)
-                    coords[estado][1].append(j)
-                    coords[estado][2].append(k)
-    
-    # Crear scatter plots
-    scatter_params = {
-        TUMOR1: {'color': 'green', 's': 30, 'alpha': 0.8, 'label': 'Tumor primario'},
-        MIGRA2: {'color': 'yellow', 's': 20, 'alpha': 0.9, 'label': 'Células migratorias'},
-        DEGRA3: {'color': 'brown', 's': 15, 'alpha': 0.7, 'label': 'Matriz degradada'},
-        META4: {'color': 'red', 's': 25, 'alpha': 0.9, 'label': 'Metástasis'}
-    }
-    
-    for estado, params in scatter_params.items():
-        if coords[estado][0]:  # Solo si hay puntos
-            ax.scatter(
-                coords[estado][0], coords[estado][1], coords[estado][2],
-                c=params['color'], s=params['s'], alpha=params['alpha'],
-                label=params['label'], depthshade=True
-            )
+    # Un scatter por estado con las coordenadas de una sola pasada por el
+    # volumen, agrupadas en bloques si pasan de `presupuesto` puntos
+    coords = coordenadas_por_estado(grid)
+    visibles, tamaños, lado = instantaneas.detalle(coords, ESTILOS, presupuesto)
+    instantaneas.artistas(ax, ESTILOS, visibles, tamaños)
     
     # Configuración
-    ax.set_title(f'Paso: {paso} - Células Migratorias: {len(coords[MIGRA2][0])}', fontsize=14)
+    ax.set_title(_titulo(paso, coords, lado), fontsize=14)
     ax.set_xlabel('X')
     ax.set_ylabel('Y')
     ax.set_zlabel('Z')
-    ax.set_xlim(0, TAMAÑO)
-    ax.set_ylim(0, TAMAÑO)
-    ax.set_zlim(0, TAMAÑO)
+    ax.set_xlim(0, tamaño)
+    ax.set_ylim(0, tamaño)
+    ax.set_zlim(0, tamaño)
     
     # Leyenda
     ax.legend(loc='upper right')
@@ -166,20 +579,189 @@ def visualizar_3d(grid, paso):
     plt.close(fig)  # Importante para liberar memoria ojito
 
 
+class VistaTumor:
+    """Ventana en vivo: se crea una vez y se actualiza en cada paso sin bloquear.
 
+    Los scatters de cada estado y el título son artistas animados, así que no
+    forman parte del fondo (paneles, ejes, leyenda). El fondo se guarda tras
+    cada dibujo completo (al abrir la ventana, al girarla o al cambiar su
+    tamaño), y actualizar() lo restaura, dibuja solo los artistas animados
+    con las coordenadas nuevas y copia el resultado a la pantalla. Si el
+    backend no admite blitting se redibuja la figura entera. Como mucho se
+    dibujan `presupuesto` puntos por cuadro (ver instantaneas.detalle).
+    """
+
+    def __init__(self, tamaño, presupuesto=instantaneas.PRESUPUESTO):
+        self.presupuesto = presupuesto
+        self.fig = plt.figure(figsize=(12, 10))
+        self.ax = ax = self.fig.add_subplot(111, projection='3d')
+        self.artistas = instantaneas.artistas(ax, ESTILOS)
+        ax.set_xlabel('X')
+        ax.set_ylabel('Y')
+        ax.set_zlabel('Z')
+        ax.set_xlim(0, tamaño)
+        ax.set_ylim(0, tamaño)
+        ax.set_zlim(0, tamaño)
+        ax.legend(loc='upper right')
+        ax.view_init(elev=30, azim=45)
+        # Con texto desde el principio para que el dibujo completo coloque el título
+        self.titulo = ax.set_title('Paso: 0', fontsize=14)
+        for artista in (*self.artistas.values(), self.titulo):
+            artista.set_animated(True)
+        self._fondo = None
+        self.fig.canvas.mpl_connect("draw_event", self._guardar_fondo)
+        plt.show(block=False)
+        self.fig.canvas.draw()
+
+    @property
+    def abierta(self):
+        return plt.fignum_exists(self.fig.number)
+
+    def _guardar_fondo(self, evento):
+        canvas = self.fig.canvas
+        if canvas.supports_blit:
+            self._fondo = canvas.copy_from_bbox(self.fig.bbox)
+        self._dibujar_animados()
+
+    def _dibujar_animados(self):
+        for artista in self.artistas.values():
+            # La proyección usa la vista del último dibujo completo
+            artista.do_3d_projection()
+            self.ax.draw_artist(artista)
+        self.ax.draw_artist(self.titulo)
+
+    def actualizar(self, grid, paso):
+        coords = coordenadas_por_estado(grid)
+        visibles, tamaños, lado = instantaneas.detalle(coords, ESTILOS, self.presupuesto)
+        instantaneas.actualizar(self.artistas, visibles, tamaños)
+        self.titulo.set_text(_titulo(paso, coords, lado))
+        canvas = self.fig.canvas
+        if self._fondo is None:
+            canvas.draw_idle()
+        else:
+            canvas.restore_region(self._fondo)
+            self._dibujar_animados()
+            canvas.blit(self.fig.bbox)
+        # Atiende la ventana (girar, cerrar...) sin detener la simulación
+        canvas.flush_events()
+
+    def cerrar(self):
+        plt.close(self.fig)
+
+
+def reproducir(ruta, presupuesto=instantaneas.PRESUPUESTO):
+    """Visor de una grabación de la simulación, con deslizador para saltar de paso"""
+    lector = trayectorias.Lector(ruta)
+    tamaño = lector.forma[0]
+    fig = plt.figure(figsize=(12, 10))
+    ax = fig.add_subplot(111, projection='3d')
+    artistas = instantaneas.artistas(ax, ESTILOS)
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    ax.set_xlim(0, tamaño)
+    ax.set_ylim(0, tamaño)
+    ax.set_zlim(0, tamaño)
+    ax.legend(loc='upper right')
+    ax.view_init(elev=30, azim=45)
+
+    def actualizar(paso, grid):
+        coords = coordenadas_por_estado(grid)
+        visibles, tamaños, lado = instantaneas.detalle(coords, ESTILOS, presupuesto)
+        instantaneas.actualizar(artistas, visibles, tamaños)
+        ax.set_title(_titulo(paso, coords, lado), fontsize=14)
+
+    trayectorias.reproducir_matplotlib(lector, fig, actualizar)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulación 3D de invasión tumoral")
+    parser.add_argument("--tamaño", type=int, default=TAMAÑO)
+    parser.add_argument("--pasos", type=int, default=PASOS)
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--replicas", type=int, default=0,
+                        help="si es mayor que 0 corre un ensamble sin visualización")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--motor", choices=MOTORES, default="referencia")
+    parser.add_argument("--grabar", metavar="ARCHIVO", help="graba la trayectoria en un .npz")
+    parser.add_argument("--reproducir", metavar="ARCHIVO", help="reproduce una grabación sin simular")
+    parser.add_argument("--memmap", metavar="DIR",
+                        help="respalda los grids en dos memmaps dentro de DIR (volúmenes grandes)")
+    parser.add_argument("--continuar", metavar="DIR",
+                        help="continúa --pasos más una simulación respaldada en DIR")
+    parser.add_argument("--perfil", metavar="ARCHIVO",
+                        help="mide cada fase del paso; escribe un registro JSON por línea")
+    parser.add_argument("--en-vivo", action="store_true",
+                        help="una sola ventana que se actualiza en cada paso sin detener la simulación")
+    parser.add_argument("--puntos", type=int, default=instantaneas.PRESUPUESTO,
+                        help="máximo de puntos por cuadro; con más células se agrupan en bloques (0: sin límite)")
+    args = parser.parse_args()
+    if args.puntos < 0:
+        parser.error("--puntos no puede ser negativo")
+    if args.memmap and args.motor == "vectorizado":
+        parser.error("--memmap necesita el motor 'referencia': el vectorizado recorre el volumen entero en memoria")
+    presupuesto = args.puntos or None
+
+    if args.reproducir:
+        reproducir(args.reproducir, presupuesto)
+        return
+
+    if args.replicas > 0:
+        print(f"Ensamble de {args.replicas} réplicas...")
+        for replica, semilla, conteos in ensamble(args.replicas, args.pasos, args.tamaño,
+                                                  args.semilla, args.procesos, args.motor):
+            final = ", ".join(f"{nombre}={n}" for nombre, n in zip(NOMBRES_CONTEO, conteos[-1]))
+            print(f"Réplica {replica} (semilla {semilla}): {final}")
+        return
+
+    if args.continuar:
+        sim = SimulacionTumor.abrir(args.continuar)
+        print(f"Continuando desde el paso {sim.paso}")
+    else:
+        sim = SimulacionTumor(args.tamaño, args.semilla, args.motor, directorio=args.memmap)
+    # Con grabación o volúmenes en disco no se abren ventanas por el camino
+    ver = not (args.grabar or args.memmap or args.continuar)
+    if args.grabar:
+        sim.grabador = trayectorias.Grabador(args.grabar)
+        sim.grabador.agregar(sim.grid)
+    if args.perfil:
+        sim.perfil = perfilado.Perfil(archivo=args.perfil)
+    vista = VistaTumor(sim.tamaño, presupuesto) if args.en_vivo else None
+    if vista is not None:
+        vista.actualizar(sim.grid, sim.paso)
+    print(f"Tumor inicial: {sim.conteos()[0]} células")
+    print("Iniciando simulación 3D...")
+    for paso in range(args.pasos):
+        start_time = time.time()
+        cambios = sim.simular_paso()
+        elapsed = time.time() - start_time
+        grid = sim.grid
+        _, migratorias, _, metastasis = sim.conteos()
+        
+        print(f"Cambios: Migración={cambios['migracion']}, Degradación={cambios['degradacion']}, "
+              f"Metástasis={cambios['metastasis']}, Crecimiento={cambios['crecimiento']}")
+        print(f"Paso {paso+1}/{args.pasos} completado en {elapsed:.2f}s - "
+              f"Migratorias: {migratorias} - "
+              f"Metástasis: {metastasis}")
+        
+        # Visualizar en cada paso crítico (o en todos, en la ventana en vivo
+        # mientras siga abierta)
+        if vista is not None:
+            if vista.abierta:
+                vista.actualizar(grid, sim.paso)
+        elif ver and (paso in [0, 2, 5] or paso % 10 == 0 or paso == args.pasos-1):
+            visualizar_3d(grid, paso, presupuesto)
+
+    if sim.grabador is not None:
+        sim.grabador.cerrar()
+        print(f"Trayectoria grabada en {args.grabar}")
+    sim.perfil.informe()
+    sim.perfil.cerrar()
+    print("Simulación completada!")
+    if vista is not None and vista.abierta:
+        # El último paso queda en pantalla hasta cerrar la ventana
+        plt.show()
 
-print("Iniciando simulación 3D...")
-for paso in range(PASOS):
-    start_time = time.time()
-    grid = simular_paso_3d(grid)
-    elapsed = time.time() - start_time
-    
-    print(f"Paso {paso+1}/{PASOS} completado en {elapsed:.2f}s - "
-          f"Migratorias: {np.sum(grid == MIGRA2)} - "
-          f"Metástasis: {np.sum(grid == META4)}")
-    
-    # Visualizar en cada paso crítico
-    if paso in [0, 2, 5] or paso % 10 == 0 or paso == PASOS-1:
-        visualizar_3d(grid, paso)
 
-print("Simulación completada!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
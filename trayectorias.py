@@ -0,0 +1,227 @@
+"""Grabación comprimida de trayectorias y lectura con acceso aleatorio.
+
+Un Grabador recibe el grid de cada paso (el primero que se agrega es el paso
+0) y lo guarda en un .npz en bloques de `pasos_por_bloque` pasos. Cada bloque
+empieza con un fotograma clave completo y sigue con los deltas dispersos de
+los demás pasos: las posiciones de los bytes que cambiaron (como saltos desde
+la anterior) y su XOR con el paso anterior. Como de un paso a otro cambia una
+fracción pequeña del grid, los deltas ocupan poco y el zip los comprime más
+todavía.
+
+Un Lector abre el archivo y reconstruye cualquier paso leyendo solo su
+bloque, así que saltar al paso N cuesta como mucho pasos_por_bloque deltas y
+no hay que volver a simular.
+
+Ejemplo:
+    with Grabador("cardumen.npz") as grabador:
+        grabador.agregar(automata.grid)
+        automata.recorder = grabador
+        for _ in range(pasos):
+            automata.update()
+
+    lector = Lector("cardumen.npz")
+    grid = lector[5000]
+"""
+import zipfile
+
+import numpy as np
+
+PASOS_POR_BLOQUE = 100
+
+
+def _nombre(bloque, parte):
+    return f"{bloque:06d}_{parte}"
+
+
+class Grabador:
+    def __init__(self, ruta, pasos_por_bloque=PASOS_POR_BLOQUE, nivel=6):
+        if pasos_por_bloque < 1:
+            raise ValueError(f"pasos_por_bloque debe ser al menos 1: {pasos_por_bloque}")
+        self.ruta = ruta
+        self.pasos_por_bloque = pasos_por_bloque
+        self.pasos = 0
+        self.forma = None
+        self.dtype = None
+        self._zip = zipfile.ZipFile(ruta, "w", zipfile.ZIP_DEFLATED, compresslevel=nivel,
+                                    allowZip64=True)
+        self._anterior = None
+        self._clave = None
+        self._indices = []
+        self._valores = []
+
+    def agregar(self, grid):
+        """Guarda el grid como el siguiente paso"""
+        grid = np.ascontiguousarray(grid)
+        if self.forma is None:
+            self.forma, self.dtype = grid.shape, grid.dtype
+        elif grid.shape != self.forma or grid.dtype != self.dtype:
+            raise ValueError(f"Se esperaba un grid {self.forma} {self.dtype}, "
+                             f"llegó {grid.shape} {grid.dtype}")
+
+        bytes_grid = grid.reshape(-1).view(np.uint8)
+        if self.pasos % self.pasos_por_bloque == 0:
+            self._cerrar_bloque()
+            self._clave = grid.copy()
+        else:
+            xor = np.bitwise_xor(bytes_grid, self._anterior)
+            cambiados = np.flatnonzero(xor)
+            # Las posiciones van ordenadas: se guardan como saltos desde la
+            # anterior, que son números pequeños y se comprimen mucho mejor
+            saltos = np.diff(cambiados, prepend=0)
+            self._indices.append(saltos.astype(np.uint32 if bytes_grid.size < 2**32 else np.uint64))
+            self._valores.append(xor[cambiados])
+        self._anterior = bytes_grid.copy()
+        self.pasos += 1
+
+    def _escribir(self, nombre, array):
+        with self._zip.open(nombre + ".npy", "w", force_zip64=True) as archivo:
+            np.lib.format.write_array(archivo, np.asarray(array), allow_pickle=False)
+
+    def _cerrar_bloque(self):
+        if self._clave is None:
+            return
+        bloque = (self.pasos - 1) // self.pasos_por_bloque
+        limites = np.cumsum([0] + [len(indices) for indices in self._indices])
+        self._escribir(_nombre(bloque, "clave"), self._clave)
+        self._escribir(_nombre(bloque, "limites"), limites)
+        if self._indices:
+            self._escribir(_nombre(bloque, "indices"), np.concatenate(self._indices))
+            self._escribir(_nombre(bloque, "valores"), np.concatenate(self._valores))
+        self._clave = None
+        self._indices = []
+        self._valores = []
+
+    def cerrar(self):
+        if self._zip is None:
+            return
+        self._cerrar_bloque()
+        if self.forma is not None:
+            self._escribir("forma", np.array(self.forma))
+            self._escribir("dtype", np.array(self.dtype.str))
+        self._escribir("pasos", np.array(self.pasos))
+        self._escribir("pasos_por_bloque", np.array(self.pasos_por_bloque))
+        self._zip.close()
+        self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class Lector:
+    """Acceso aleatorio a un archivo de Grabador: lector[paso] devuelve el grid.
+
+    Guarda el último paso reconstruido, así que recorrer los pasos en orden
+    solo aplica un delta por paso.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._npz = np.load(ruta, allow_pickle=False)
+        self.pasos = int(self._npz["pasos"])
+        self.pasos_por_bloque = int(self._npz["pasos_por_bloque"])
+        if self.pasos == 0:
+            raise ValueError(f"{ruta} no tiene pasos grabados")
+        self.forma = tuple(self._npz["forma"].tolist())
+        self.dtype = np.dtype(str(self._npz["dtype"]))
+        self._bloque = None
+        self._paso = None
+        self._bytes = None
+
+    def __len__(self):
+        return self.pasos
+
+    def _cargar_bloque(self, bloque):
+        self._bloque = bloque
+        self._limites = self._npz[_nombre(bloque, "limites")]
+        if len(self._limites) > 1:
+            self._indices = self._npz[_nombre(bloque, "indices")]
+            self._valores = self._npz[_nombre(bloque, "valores")]
+        self._clave = self._npz[_nombre(bloque, "clave")].reshape(-1).view(np.uint8)
+
+    def __getitem__(self, paso):
+        paso = int(paso)
+        if paso < 0:
+            paso += self.pasos
+        if not 0 <= paso < self.pasos:
+            raise IndexError(f"Paso {paso} fuera de rango (hay {self.pasos})")
+
+        bloque, desde = divmod(paso, self.pasos_por_bloque)
+        if bloque != self._bloque:
+            self._cargar_bloque(bloque)
+        if self._paso is None or self._paso // self.pasos_por_bloque != bloque or self._paso > paso:
+            self._bytes = self._clave.copy()
+            actual = 0
+        else:
+            actual = self._paso % self.pasos_por_bloque
+
+        # El delta d del bloque lleva del paso d al d + 1
+        for delta in range(actual, desde):
+            inicio, fin = self._limites[delta], self._limites[delta + 1]
+            self._bytes[np.cumsum(self._indices[inicio:fin])] ^= self._valores[inicio:fin]
+        self._paso = paso
+        return self._bytes.view(self.dtype).reshape(self.forma).copy()
+
+    def __iter__(self):
+        for paso in range(self.pasos):
+            yield self[paso]
+
+    def cerrar(self):
+        self._npz.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def reproducir_matplotlib(lector, fig, actualizar, intervalo=200):
+    """Visor de una grabación en una figura de matplotlib ya creada.
+
+    actualizar(paso, grid) redibuja los artistas de la figura. Añade un
+    deslizador para saltar a cualquier paso; espacio reproduce o pausa, las
+    flechas avanzan o retroceden un paso y AvPág/RePág cien.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.widgets import Slider
+
+    fig.subplots_adjust(bottom=0.1)
+    eje = fig.add_axes([0.15, 0.03, 0.7, 0.03])
+    deslizador = Slider(eje, "Paso", 0, len(lector) - 1, valinit=0, valstep=1, valfmt="%d")
+
+    def mostrar(valor):
+        paso = int(valor)
+        actualizar(paso, lector[paso])
+        fig.canvas.draw_idle()
+
+    def avanzar():
+        paso = int(deslizador.val) + 1
+        if paso >= len(lector):
+            temporizador.stop()
+        else:
+            deslizador.set_val(paso)
+
+    def tecla(evento):
+        saltos = {"right": 1, "left": -1, "pagedown": 100, "pageup": -100}
+        if evento.key == " ":
+            temporizador.reproduciendo = not temporizador.reproduciendo
+            if temporizador.reproduciendo:
+                temporizador.start()
+            else:
+                temporizador.stop()
+        elif evento.key in saltos:
+            paso = int(deslizador.val) + saltos[evento.key]
+            deslizador.set_val(min(max(paso, 0), len(lector) - 1))
+
+    temporizador = fig.canvas.new_timer(interval=intervalo)
+    temporizador.add_callback(avanzar)
+    temporizador.reproduciendo = False
+    deslizador.on_changed(mostrar)
+    fig.canvas.mpl_connect("key_press_event", tecla)
+    mostrar(0)
+    # Referencias vivas mientras la ventana esté abierta
+    fig._reproduccion = (deslizador, temporizador)
+    plt.show()
@@ -0,0 +1,71 @@
+"""Tablas de vecindad 3D precalculadas para las simulaciones.
+
+Los desplazamientos de cada radio y conectividad se calculan una sola vez y
+quedan en caché como arrays de solo lectura, junto con sus distancias y
+vectores unitarios, en lugar de reconstruir listas de tuplas en cada llamada.
+"""
+import functools
+
+import numpy as np
+
+# Conectividad de una celda: solo caras, caras y aristas, o el cubo completo.
+# Para radios mayores que 1 limita cuántas coordenadas pueden ser distintas de 0
+CONECTIVIDADES = {6: 1, 18: 2, 26: 3}
+
+
+def _solo_lectura(array):
+    array.flags.writeable = False
+    return array
+
+
+@functools.lru_cache(maxsize=None)
+def desplazamientos(radio=1, conectividad=None, orden="C"):
+    """Desplazamientos (K, 3) alrededor de una celda, sin el (0, 0, 0).
+
+    Con conectividad None se toma el cubo completo de lado 2*radio+1. En
+    orden "C" el primer eje es el que cambia más despacio (el recorrido
+    i, j, k); en orden "F" es el que cambia más deprisa.
+    """
+    if conectividad is not None and conectividad not in CONECTIVIDADES:
+        raise ValueError(f"Conectividad desconocida: {conectividad} (opciones: 6, 18, 26)")
+    if orden not in ("C", "F"):
+        raise ValueError(f"Orden desconocido: {orden!r} (opciones: 'C', 'F')")
+    rango = np.arange(-radio, radio + 1)
+    ejes = np.meshgrid(rango, rango, rango, indexing="ij")
+    if orden == "F":
+        ejes = ejes[::-1]
+    tabla = np.stack([eje.ravel() for eje in ejes], axis=1)
+    no_nulas = np.count_nonzero(tabla, axis=1)
+    limite = 3 if conectividad is None else CONECTIVIDADES[conectividad]
+    return _solo_lectura(tabla[(no_nulas > 0) & (no_nulas <= limite)])
+
+
+@functools.lru_cache(maxsize=None)
+def desplazamientos_tuplas(radio=1, conectividad=None, orden="C"):
+    """Los mismos desplazamientos como tupla de tuplas, para bucles en Python"""
+    return tuple(map(tuple, desplazamientos(radio, conectividad, orden).tolist()))
+
+
+@functools.lru_cache(maxsize=None)
+def distancias(radio=1, conectividad=None, orden="C"):
+    """Distancia euclídea de cada desplazamiento y su vector unitario (K, 3)"""
+    tabla = desplazamientos(radio, conectividad, orden)
+    distancia = np.sqrt((tabla**2).sum(axis=1))
+    unitarios = tabla / distancia[:, None]
+    return _solo_lectura(distancia), _solo_lectura(unitarios)
+
+
+def vecinos(pos, radio, tamaño, conectividad=None, periodico=True, orden="C"):
+    """Coordenadas (K, 3) de los vecinos de pos en un cubo de lado tamaño.
+
+    Con periodico se envuelven con %; si no, se descartan las que caen fuera.
+    """
+    coords = np.asarray(pos) + desplazamientos(radio, conectividad, orden)
+    if periodico:
+        return coords % tamaño
+    return coords[((coords >= 0) & (coords < tamaño)).all(axis=1)]
+
+
+def en_interior(pos, radio, tamaño):
+    """True si ningún vecino a distancia radio se sale del cubo"""
+    return all(radio <= c < tamaño - radio for c in pos)